@@ -1,10 +1,31 @@
 import streamlit as st
-import requests
-import uuid
-import json
 import pandas as pd
 from datetime import datetime
-import io
+import math
+
+from storage import (
+    HISTORY_PAGE_SIZE, EXPORT_FORMATS, count_history, query_history, history_version,
+    history_status_counts, history_throughput, history_record, history_breakdown, process_dataframe,
+    export_history, STATS_WINDOWS,
+)
+from verifier import (
+    RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, RETRY_MAX_ATTEMPTS, environment_name, read_pan_file,
+    get_api_stats, get_circuit_breaker, normalize_pan, validate_pan, prepare_pans, METRICS_PORT, serve_metrics,
+    parse_credentials, single_credential, get_credential_pool, CredentialConfigError,
+)
+from metrics import get_call_metrics
+from jobs import ACTIVE_JOB_STATUSES, RESUMABLE_JOB_STATUSES, get_job_runner, get_job, list_jobs, job_results, job_response
+
+# --- Bulk Settings ---
+BULK_MAX_CONCURRENCY = 16
+BULK_DEFAULT_CONCURRENCY = 4
+
+# --- Job Settings ---
+JOB_POLL_SECONDS = 1.0
+JOB_LIST_SIZE = 25
+
+# --- History Settings ---
+SEARCH_MIN_CHARS = 2
 
 # --- Page Config ---
 st.set_page_config(
@@ -110,80 +131,170 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# --- Session State ---
-if 'history' not in st.session_state:
-    st.session_state.history = []
-
 # --- Helper Functions ---
-def add_to_history(pan, name, udyam, status):
-    st.session_state.history.insert(0, {
-        "Time": datetime.now().strftime("%H:%M:%S"),
-        "UDYAM NO.": udyam,
-        "PAN": pan,
-        "Entity Name": name,
-        "Status": status
-    })
-
-def fetch_udyam_details(client_id, client_secret, pan_number, use_sandbox):
-    if not client_id or not client_secret:
-        return {
-            "status": "ERROR", 
-            "message": "API Keys Missing. Please provide Client ID and Secret in sidebar."
+@st.cache_resource
+def start_metrics_endpoint():
+    """Starts the Prometheus /metrics endpoint once per server process (port in use => disabled)"""
+    if not METRICS_PORT:
+        return None
+    try:
+        return serve_metrics(METRICS_PORT)
+    except OSError:
+        return None
+
+metrics_server = start_metrics_endpoint()
+# Creating the runner marks jobs orphaned by a previous server process as interrupted
+get_job_runner()
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:,.0f} ms"
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def load_history_frame(search_term, limit, offset, version):
+    """Memoized history page; `version` (see history_version) invalidates it only when rows are appended"""
+    return process_dataframe(query_history(search_term, limit, offset), start=offset + 1)
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def load_history_count(search_term, version):
+    return count_history(search_term)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_history_breakdown(field, version):
+    return pd.Series(history_breakdown(field), dtype="int64")
+
+def load_job_rows(job_id):
+    """A job's result rows, fetching only those finished since this session last polled"""
+    rows = st.session_state.setdefault("job_rows", {}).setdefault(job_id, [])
+    rows.extend(job_results(job_id, after=len(rows)))
+    return rows
+
+def watch_job(job_id, label, show_rows=True):
+    """Polls a queued/running job without blocking the script, then reruns the page once it finishes"""
+
+    @st.fragment(run_every=JOB_POLL_SECONDS)
+    def poll():
+        job = get_job(job_id)
+        if job["status"] not in ACTIVE_JOB_STATUSES:
+            st.rerun()
+        st.progress(job["done"] / max(1, job["total"]), text=f"{label} {job['done']} / {job['total']} · job {job_id}")
+        if show_rows:
+            show_job_results(job, load_job_rows(job_id), downloadable=False)
+
+    poll()
+
+def show_job_results(job, rows, downloadable=True):
+    if not rows:
+        return
+    df_job = pd.DataFrame(rows)
+    status_counts = df_job['Status'].value_counts()
+    s1, s2, s3, s4, s5 = st.columns(5)
+    s1.metric("Verified", int(status_counts.get("Verified", 0)))
+    s2.metric("Not Found", int(status_counts.get("Not Found", 0)))
+    s3.metric("Errors", int(status_counts.get("Error", 0)))
+    s4.metric("Rejected", int(status_counts.get("Rejected", 0)))
+    s5.metric("Duplicates Skipped", job["duplicates"])
+    st.dataframe(
+        df_job,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Status": st.column_config.TextColumn("Status", width="small"),
+            "UDYAM NO.": st.column_config.TextColumn("UDYAM NO.", width="medium"),
+            "PAN": st.column_config.TextColumn("PAN", width="medium"),
+            "Entity Name": st.column_config.TextColumn("Entity Name", width="large"),
+            "Source": st.column_config.TextColumn("Source", width="small"),
+            "Message": st.column_config.TextColumn("Message", width="large"),
         }
+    )
+    if downloadable:
+        st.download_button(
+            label="📥 Download Results (CSV)",
+            data=df_job.to_csv(index=False).encode("utf-8"),
+            file_name=f"verification_job_{job['id']}.csv",
+            mime="text/csv",
+            key=f"download_job_{job['id']}",
+            use_container_width=True
+        )
+
+def render_response(pan_number, response):
+    """Detail card (or error) for one API response; also used to re-open stored results"""
+    if response.get("status") == "SUCCESS":
+        data = response.get("data", {})
+        if not data:
+            st.error("API returned Success but no data.")
+        else:
+            st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
+            with st.container():
+                st.markdown(f"""
+                <div style="display: flex; flex-wrap: wrap; gap: 24px; background-color: #f8fafc; padding: 24px; border-radius: 12px; border: 1px solid #e2e8f0;">
+                    
+                    <div style="flex: 1; min-width: 250px; display: flex; flex-direction: column; gap: 16px;">
+                        <div style="background: white; padding: 20px; border-radius: 12px; border: 1px solid #d1fae5; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
+                            <div style="display: flex; align-items: center; gap: 8px; margin-bottom: 12px;">
+                                <div style="width: 24px; height: 24px; background: #d1fae5; border-radius: 50%; display: flex; align-items: center; justify-content: center; color: #059669;">✔</div>
+                                <span style="color: #047857; font-weight: 600; font-size: 14px;">Active & Verified</span>
+                            </div>
+                            <div style="font-size: 28px; font-weight: 700; color: #0f172a;">{data.get('enterprise_type', 'N/A')}</div>
+                            <div style="font-size: 11px; font-weight: 600; color: #64748b; text-transform: uppercase; letter-spacing: 0.05em; margin-top: 4px;">Enterprise Type</div>
+                        </div>
 
-    if use_sandbox:
-        base_url = "https://sandbox.cashfree.com/verification"
+                        <div style="background: white; padding: 20px; border-radius: 12px; border: 1px solid #e2e8f0;">
+                             <div style="font-size: 11px; font-weight: 600; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 8px;">Udyam Registration Number</div>
+                             <div style="background: #f8fafc; padding: 12px; border-radius: 8px; border: 1px dashed #cbd5e1; display: flex; justify-content: space-between; align-items: center;">
+                                <code style="color: #2563eb; font-weight: 700; font-size: 14px;">{data.get('udyamNumber', 'N/A')}</code>
+                             </div>
+                        </div>
+                    </div>
+
+                    <div style="flex: 2; min-width: 300px; background: white; padding: 24px; border-radius: 12px; border: 1px solid #e2e8f0;">
+                        <div style="display: flex; justify-content: space-between; margin-bottom: 24px; padding-bottom: 16px; border-bottom: 1px solid #f1f5f9;">
+                            <h3 style="font-size: 16px; font-weight: 600; color: #0f172a; margin: 0; display: flex; align-items: center; gap: 8px;">
+                                🏢 Entity Details
+                            </h3>
+                        </div>
+                        
+                        <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 24px;">
+                            <div>
+                                <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Registered Name</label>
+                                <div style="font-weight: 500; color: #0f172a;">{data.get('name', 'N/A')}</div>
+                            </div>
+                            <div>
+                                <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Major Activity</label>
+                                <div style="font-weight: 500; color: #0f172a;">{data.get('major_activity', 'N/A')}</div>
+                            </div>
+                            <div>
+                                <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Registration Date</label>
+                                <div style="font-weight: 500; color: #0f172a;">{data.get('date_of_registration', 'N/A')}</div>
+                            </div>
+                            <div>
+                                <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Location</label>
+                                <div style="font-weight: 500; color: #0f172a;">{data.get('district', '')}, {data.get('state', '')}</div>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+
+    elif response.get("status") == "UDYAM_NOT_FOUND":
+        st.error(f"No Udyam Registration found for PAN: {pan_number}")
+    elif response.get("status") == "ERROR":
+        st.error(f"System Error: {response.get('message')}")
     else:
-        base_url = "https://api.cashfree.com/verification"
-
-    endpoint = f"{base_url}/pan-udyam"
-    headers = {
-        "x-client-id": client_id,
-        "x-client-secret": client_secret,
-        "Content-Type": "application/json",
-    }
-    
-    try:
-        response = requests.post(endpoint, headers=headers, data=json.dumps({
-            "verification_id": str(uuid.uuid4()),
-            "pan": pan_number
-        }), timeout=10)
-        
-        if response.status_code != 200:
-            try:
-                err_data = response.json()
-                return {"status": "ERROR", "message": err_data.get("message", response.reason)}
-            except:
-                return {"status": "ERROR", "message": f"HTTP {response.status_code}: {response.reason}"}
-
-        return response.json()
-    except requests.exceptions.Timeout:
-        return {"status": "ERROR", "message": "Request timed out."}
-    except Exception as e:
-        return {"status": "ERROR", "message": str(e)}
-
-def convert_df_to_excel(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Verification History')
-    return output.getvalue()
-
-def process_dataframe(data_list):
-    """Standardizes the dataframe structure"""
-    if not data_list:
-        return pd.DataFrame()
-    
-    df = pd.DataFrame(data_list)
-    # Create S.No. (1 to N)
-    df.insert(0, 'S.No.', range(1, 1 + len(df)))
-    
-    # STRICT COLUMN ORDER
-    required_cols = ['S.No.', 'Status', 'UDYAM NO.', 'PAN', 'Entity Name', 'Time']
-    for col in required_cols:
-        if col not in df.columns:
-            df[col] = "-"
-            
-    return df[required_cols]
+        st.error(f"API Error: {response.get('message', 'Unknown Error')}")
+
+def render_job(job_id):
+    """Progress while a job runs (polled), its results once it has finished"""
+    job = get_job(job_id)
+    if job is None:
+        st.warning(f"No job found with ID {job_id}.")
+    elif job["status"] in ACTIVE_JOB_STATUSES:
+        watch_job(job_id, "Verifying")
+    else:
+        if job["status"] == "interrupted":
+            st.warning(f"Job {job_id} was interrupted after {job['done']} / {job['total']} lookups.")
+        elif job["status"] == "failed":
+            st.error(f"Job {job_id} stopped with an internal error after {job['done']} / {job['total']} lookups.")
+        show_job_results(job, load_job_rows(job_id))
 
 # --- SIDEBAR CONTENT ---
 with st.sidebar:
@@ -198,24 +309,32 @@ with st.sidebar:
     
     st.markdown("<p style='font-size: 12px; font-weight: 600; color: #64748b; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 10px;'>Configuration</p>", unsafe_allow_html=True)
 
+    # A [[CASHFREE_CREDENTIALS]] array of keys takes precedence over the single CASHFREE_CLIENT_ID / _SECRET pair
     try:
-        default_id = st.secrets["CASHFREE_CLIENT_ID"]
-        default_secret = st.secrets["CASHFREE_CLIENT_SECRET"]
-        secrets_found = True
+        if "CASHFREE_CREDENTIALS" in st.secrets:
+            credentials = parse_credentials(st.secrets["CASHFREE_CREDENTIALS"])
+        else:
+            credentials = single_credential(st.secrets["CASHFREE_CLIENT_ID"], st.secrets["CASHFREE_CLIENT_SECRET"])
     except (FileNotFoundError, KeyError):
-        default_id = ""
-        default_secret = ""
-        secrets_found = False
-
-    if secrets_found:
-        st.success("🔒 Secured by Cloud Secrets")
-        client_id = default_id
-        client_secret = default_secret
+        credentials = ()
+    except CredentialConfigError as e:
+        st.error(f"Invalid CASHFREE_CREDENTIALS in secrets: {e}")
+        credentials = ()
+
+    if credentials:
+        st.success("🔒 Secured by Cloud Secrets" + (f" · {len(credentials)} API keys" if len(credentials) > 1 else ""))
     else:
         client_id = st.text_input("Client ID", value="", placeholder="Required")
         client_secret = st.text_input("Client Secret", value="", type="password", placeholder="Required")
+        credentials = single_credential(client_id, client_secret)
             
     use_sandbox = st.toggle("Sandbox Mode", value=True)
+    force_refresh = st.toggle("Bypass Cache", value=False, help="Always call the live API and refresh the cached result.")
+
+    if len(credentials) > 1:
+        with st.expander("API Key Pool"):
+            st.dataframe(pd.DataFrame(get_credential_pool(credentials).snapshot()), use_container_width=True, hide_index=True)
+            st.caption("Lookups go to the least-loaded key (per unit of weight); keys that hit 429s or auth errors cool down.")
     
     st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
     
@@ -223,7 +342,7 @@ with st.sidebar:
     
     selected_page = st.radio(
         "Navigate",
-        ["Verify Identity", "History Log", "Usage Analytics"],
+        ["Verify Identity", "History Log", "Background Jobs", "Usage Analytics"],
         label_visibility="collapsed"
     )
 
@@ -258,92 +377,69 @@ if selected_page == "Verify Identity":
 
         c1, c2 = st.columns([5, 1])
         with c1:
-            pan_number = st.text_input("PAN Number", placeholder="ABCDE1234F", label_visibility="collapsed").upper()
+            pan_number = normalize_pan(st.text_input("PAN Number", placeholder="ABCDE1234F", label_visibility="collapsed"))
         with c2:
             fetch_btn = st.button("Verify", use_container_width=True)
 
     if fetch_btn:
-        if len(pan_number) < 5:
-            st.toast("Please enter a valid PAN.", icon="⚠️")
+        pan_error = validate_pan(pan_number)
+        if pan_error:
+            st.toast(f"Please enter a valid PAN. {pan_error}.", icon="⚠️")
         else:
-            with st.spinner("Connecting to Registry API..."):
-                response = fetch_udyam_details(client_id, client_secret, pan_number, use_sandbox)
+            # Runs on the shared job pool; the page polls for the result instead of blocking on the API
+            st.session_state.single_job = get_job_runner().submit(
+                credentials, [pan_number], use_sandbox, 1, force_refresh, kind="single"
+            )
 
-            if response.get("status") == "SUCCESS":
-                data = response.get("data", {})
-                if not data:
-                    st.error("API returned Success but no data.")
-                else:
-                    add_to_history(pan_number, data.get("name", "N/A"), data.get("udyamNumber", "N/A"), "Verified")
-                    
-                    st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
-                    with st.container():
-                        st.markdown(f"""
-                        <div style="display: flex; flex-wrap: wrap; gap: 24px; background-color: #f8fafc; padding: 24px; border-radius: 12px; border: 1px solid #e2e8f0;">
-                            
-                            <div style="flex: 1; min-width: 250px; display: flex; flex-direction: column; gap: 16px;">
-                                <div style="background: white; padding: 20px; border-radius: 12px; border: 1px solid #d1fae5; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
-                                    <div style="display: flex; align-items: center; gap: 8px; margin-bottom: 12px;">
-                                        <div style="width: 24px; height: 24px; background: #d1fae5; border-radius: 50%; display: flex; align-items: center; justify-content: center; color: #059669;">✔</div>
-                                        <span style="color: #047857; font-weight: 600; font-size: 14px;">Active & Verified</span>
-                                    </div>
-                                    <div style="font-size: 28px; font-weight: 700; color: #0f172a;">{data.get('enterprise_type', 'N/A')}</div>
-                                    <div style="font-size: 11px; font-weight: 600; color: #64748b; text-transform: uppercase; letter-spacing: 0.05em; margin-top: 4px;">Enterprise Type</div>
-                                </div>
-
-                                <div style="background: white; padding: 20px; border-radius: 12px; border: 1px solid #e2e8f0;">
-                                     <div style="font-size: 11px; font-weight: 600; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 8px;">Udyam Registration Number</div>
-                                     <div style="background: #f8fafc; padding: 12px; border-radius: 8px; border: 1px dashed #cbd5e1; display: flex; justify-content: space-between; align-items: center;">
-                                        <code style="color: #2563eb; font-weight: 700; font-size: 14px;">{data.get('udyamNumber', 'N/A')}</code>
-                                     </div>
-                                </div>
-                            </div>
+    single_job = get_job(st.session_state.single_job) if st.session_state.get("single_job") else None
+    if single_job and single_job["status"] in ACTIVE_JOB_STATUSES:
+        watch_job(single_job["id"], "Connecting to Registry API...", show_rows=False)
+    elif single_job and job_response(single_job["id"]) is None:
+        st.warning(f"Job {single_job['id']} did not finish. Resume it from Background Jobs.")
+    elif single_job:
+        pan_number, response = job_response(single_job["id"])
+        if response.get("cached_at"):
+            st.caption(f"⚡ Served from cache · fetched {response['cached_at']} · enable 'Bypass Cache' in the sidebar to refresh")
 
-                            <div style="flex: 2; min-width: 300px; background: white; padding: 24px; border-radius: 12px; border: 1px solid #e2e8f0;">
-                                <div style="display: flex; justify-content: space-between; margin-bottom: 24px; padding-bottom: 16px; border-bottom: 1px solid #f1f5f9;">
-                                    <h3 style="font-size: 16px; font-weight: 600; color: #0f172a; margin: 0; display: flex; align-items: center; gap: 8px;">
-                                        🏢 Entity Details
-                                    </h3>
-                                </div>
-                                
-                                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 24px;">
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Registered Name</label>
-                                        <div style="font-weight: 500; color: #0f172a;">{data.get('name', 'N/A')}</div>
-                                    </div>
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Major Activity</label>
-                                        <div style="font-weight: 500; color: #0f172a;">{data.get('major_activity', 'N/A')}</div>
-                                    </div>
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Registration Date</label>
-                                        <div style="font-weight: 500; color: #0f172a;">{data.get('date_of_registration', 'N/A')}</div>
-                                    </div>
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #64748b; margin-bottom: 4px;">Location</label>
-                                        <div style="font-weight: 500; color: #0f172a;">{data.get('district', '')}, {data.get('state', '')}</div>
-                                    </div>
-                                </div>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
+        render_response(pan_number, response)
 
-            elif response.get("status") == "UDYAM_NOT_FOUND":
-                add_to_history(pan_number, "Unknown", "-", "Not Found")
-                st.error(f"No Udyam Registration found for PAN: {pan_number}")
-            elif response.get("status") == "ERROR":
-                st.error(f"System Error: {response.get('message')}")
+    # Bulk Verification
+    st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
+    with st.expander("📂 Bulk Verification (CSV / XLSX)"):
+        st.caption("Upload a file with a 'PAN' column (or PANs in the first column). The batch runs in the background: you can leave this page and pick it up later under Background Jobs.")
+        b1, b2 = st.columns([3, 1])
+        with b1:
+            bulk_file = st.file_uploader("PAN File", type=["csv", "xlsx"], label_visibility="collapsed")
+        with b2:
+            concurrency = st.slider("Parallel Requests", min_value=1, max_value=BULK_MAX_CONCURRENCY, value=BULK_DEFAULT_CONCURRENCY)
+            strict_pans = st.checkbox("Strict PAN checks", help="Also reject PANs that match the format but cannot have been issued (e.g. serial 0000).")
+            bulk_btn = st.button("Verify All", use_container_width=True, disabled=bulk_file is None)
+
+        if bulk_btn:
+            raw_pans = read_pan_file(bulk_file)
+            pans, rejected, duplicates = prepare_pans(raw_pans, strict_pans)
+            if not raw_pans:
+                st.toast("No PANs found in the uploaded file.", icon="⚠️")
+            elif pans and not credentials:
+                st.toast("API Keys Missing. Please provide Client ID and Secret in sidebar.", icon="⚠️")
             else:
-                st.error(f"API Error: {response.get('message', 'Unknown Error')}")
+                # Rejected rows are reported alongside the results but never sent to the API
+                st.session_state.bulk_job = get_job_runner().submit(
+                    credentials, pans, use_sandbox, concurrency, force_refresh, rejected, duplicates
+                )
+
+        if st.session_state.get("bulk_job"):
+            st.caption(f"Job ID: `{st.session_state.bulk_job}`")
+            render_job(st.session_state.bulk_job)
 
     # Recent Table on Home Page
-    if st.session_state.history:
+    df_recent = load_history_frame("", 5, 0, history_version())
+    if not df_recent.empty:
         st.markdown("<div style='height: 40px'></div>", unsafe_allow_html=True)
         st.markdown("<h3 style='font-size: 18px; font-weight: 600; color: #1e293b; margin-bottom: 12px;'>Recent Verifications</h3>", unsafe_allow_html=True)
         
-        df_recent = process_dataframe(st.session_state.history)
         st.dataframe(
-            df_recent.head(5),
+            df_recent,
             use_container_width=True,
             hide_index=True,
             column_config={
@@ -352,93 +448,183 @@ if selected_page == "Verify Identity":
                 "UDYAM NO.": st.column_config.TextColumn("UDYAM NO.", width="medium"),
                 "PAN": st.column_config.TextColumn("PAN", width="medium"),
                 "Entity Name": st.column_config.TextColumn("Entity Name", width="large"),
-                "Time": st.column_config.TextColumn("Time", width="small"),
+                "Time": st.column_config.TextColumn("Time", width="medium"),
+                "Source": st.column_config.TextColumn("Source", width="small"),
             }
         )
 
 
 # --- PAGE 2: HISTORY LOG ---
 elif selected_page == "History Log":
-    if st.session_state.history:
-        df = process_dataframe(st.session_state.history)
-        
+    version = history_version()
+    total_records = load_history_count("", version)
+    if total_records:
         with st.container():
             st.markdown("<div style='background: white; padding: 20px; border-radius: 12px; border: 1px solid #e2e8f0; margin-bottom: 20px;'>", unsafe_allow_html=True)
             f_col1, f_col2, f_col3 = st.columns([2, 1, 1])
             
             with f_col1:
-                search_term = st.text_input("🔍 Search", placeholder="PAN or Company Name", label_visibility="collapsed")
+                search_term = st.text_input("🔍 Search", placeholder="PAN, Udyam No. or Company Name", label_visibility="collapsed").strip()
+                # Text inputs only submit on Enter/blur; very short terms would match nearly everything
+                if 0 < len(search_term) < SEARCH_MIN_CHARS:
+                    st.caption(f"Type at least {SEARCH_MIN_CHARS} characters to search.")
+                    search_term = ""
             
+            matched = load_history_count(search_term, version) if search_term else total_records
+            page_count = max(1, math.ceil(matched / HISTORY_PAGE_SIZE))
+
             with f_col2:
-                min_sno = int(df['S.No.'].min())
-                max_sno = int(df['S.No.'].max())
-                
-                if min_sno == max_sno:
-                    selected_range = (min_sno, max_sno)
-                    st.caption(f"S.No: {min_sno}")
+                if page_count == 1:
+                    page = 1
+                    st.caption("Page 1 of 1")
                 else:
-                    selected_range = st.slider("S.No. Range", min_value=min_sno, max_value=max_sno, value=(min_sno, max_sno), label_visibility="collapsed")
+                    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, label_visibility="collapsed")
+                    st.caption(f"Page {page} of {page_count}")
             
             with f_col3:
-                filtered_df = df.copy()
-                
-                if search_term:
-                    filtered_df = filtered_df[
-                        filtered_df['PAN'].str.contains(search_term, case=False) | 
-                        filtered_df['Entity Name'].str.contains(search_term, case=False)
-                    ]
-                
-                if min_sno != max_sno:
-                    filtered_df = filtered_df[
-                        (filtered_df['S.No.'] >= selected_range[0]) & 
-                        (filtered_df['S.No.'] <= selected_range[1])
-                    ]
-                
-                excel_data = convert_df_to_excel(filtered_df)
+                export_format = st.selectbox("Export Format", list(EXPORT_FORMATS), label_visibility="collapsed")
+                extension, mime, _ = EXPORT_FORMATS[export_format]
+                # The export is only generated when the button is clicked, off the script thread
                 st.download_button(
-                    label="📥 Download Excel",
-                    data=excel_data,
-                    file_name=f"verification_log_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    label=f"📥 Download {export_format}",
+                    data=lambda: export_history(search_term, export_format),
+                    file_name=f"verification_log_{datetime.now().strftime('%Y%m%d')}.{extension}",
+                    mime=mime,
                     use_container_width=True
                 )
             st.markdown("</div>", unsafe_allow_html=True)
 
-        st.dataframe(
+        offset = (page - 1) * HISTORY_PAGE_SIZE
+        filtered_df = load_history_frame(search_term, HISTORY_PAGE_SIZE, offset, version)
+        history_table = st.dataframe(
             filtered_df, 
             use_container_width=True,
             hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
             column_config={
                 "S.No.": st.column_config.NumberColumn("S.No.", width="small"),
                 "Status": st.column_config.TextColumn("Status", width="small"),
                 "UDYAM NO.": st.column_config.TextColumn("UDYAM NO.", width="medium"),
                 "PAN": st.column_config.TextColumn("PAN", width="medium"),
                 "Entity Name": st.column_config.TextColumn("Entity Name", width="large"),
-                "Time": st.column_config.TextColumn("Time", width="small"),
+                "Time": st.column_config.TextColumn("Time", width="medium"),
+                "Source": st.column_config.TextColumn("Source", width="small"),
             }
         )
-        st.caption(f"Showing {len(filtered_df)} of {len(df)} records")
+        if len(filtered_df):
+            st.caption(f"Showing {offset + 1}–{offset + len(filtered_df)} of {matched} matching records ({total_records} total) · select a row to view its details")
+        else:
+            st.caption(f"No records match '{search_term}' ({total_records} total)")
+
+        # Details are re-rendered from the stored response; no API call is made
+        if history_table.selection.rows:
+            record = history_record(search_term, offset + history_table.selection.rows[0])
+            if record is None:
+                st.info("That record is no longer on this page. Please select it again.")
+            elif record.payload is None:
+                st.info(f"No stored response for {record.pan}: it was verified before full responses were kept.")
+            else:
+                st.caption(f"Stored result for {record.pan} · verified {record.created_at} ({record.environment})")
+                render_response(record.pan, record.response())
         
     else:
         st.info("No verification history available. Please verify a PAN first.")
 
 
-# --- PAGE 3: USAGE ANALYTICS ---
+# --- PAGE 3: BACKGROUND JOBS ---
+elif selected_page == "Background Jobs":
+    recent_jobs = list_jobs(JOB_LIST_SIZE)
+    if recent_jobs:
+        st.dataframe(
+            pd.DataFrame([{
+                "Job ID": job["id"],
+                "Type": job["kind"].title(),
+                "Status": job["status"].title(),
+                "Environment": job["environment"].title(),
+                "Progress": f"{job['done']} / {job['total']}",
+                "Created": job["created_at"],
+                "Finished": job["finished_at"] or "-",
+            } for job in recent_jobs]),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+        j1, j2 = st.columns([2, 1])
+        with j1:
+            job_ids = [job["id"] for job in recent_jobs]
+            own_job = st.session_state.get("bulk_job")
+            selected_job = st.selectbox("Job", job_ids, index=job_ids.index(own_job) if own_job in job_ids else 0)
+        with j2:
+            lookup_id = st.text_input("Look up Job ID", placeholder="Any job ID").strip()
+        job_id = lookup_id or selected_job
+
+        job = get_job(job_id)
+        if job and job["status"] in RESUMABLE_JOB_STATUSES and job["done"] < job["total"]:
+            if st.button("Resume Job", key=f"resume_{job_id}"):
+                if not credentials:
+                    st.toast("API Keys Missing. Please provide Client ID and Secret in sidebar.", icon="⚠️")
+                elif get_job_runner().resume(job_id, credentials):
+                    st.rerun()
+                else:
+                    st.toast(f"Job {job_id} has already been resumed.", icon="ℹ️")
+        render_job(job_id)
+    else:
+        st.info("No background jobs yet. Single and bulk verifications run here as jobs.")
+
+
+# --- PAGE 4: USAGE ANALYTICS ---
 elif selected_page == "Usage Analytics":
-    if st.session_state.history:
-        df = process_dataframe(st.session_state.history)
-        
-        total_calls = len(df)
-        verified_count = len(df[df['Status'] == 'Verified'])
-        not_found_count = len(df[df['Status'] == 'Not Found'])
+    api_stats = get_api_stats().snapshot()
+    a1, a2, a3, a4, a5, a6 = st.columns(6)
+    a1.metric("Retries", api_stats["retries"])
+    a2.metric("Throttled Waits", api_stats["throttled"])
+    a3.metric("429 Responses", api_stats["rate_limited"])
+    a4.metric("Circuit Rejections", api_stats["circuit_rejections"])
+    a5.metric("Coalesced Lookups", api_stats["coalesced"], help="Concurrent lookups of the same PAN that shared one API call")
+    a6.metric("Circuit", get_circuit_breaker(environment_name(use_sandbox)).state.title())
+    st.caption(f"Client limit: {RATE_LIMIT_PER_SECOND:g} req/s per API key and environment (burst {RATE_LIMIT_BURST}) · up to {RETRY_MAX_ATTEMPTS} attempts per lookup · counters since server start")
+    st.markdown("<div style='height: 32px'></div>", unsafe_allow_html=True)
+
+    call_metrics = get_call_metrics()
+    latency = call_metrics.summary()
+    if latency:
+        st.subheader("Upstream Latency")
+        for environment, summary in latency.items():
+            l1, l2, l3, l4, l5 = st.columns(5)
+            l1.metric(f"{environment.title()} p50", format_ms(summary["p50"]))
+            l2.metric("p95", format_ms(summary["p95"]))
+            l3.metric("p99", format_ms(summary["p99"]))
+            l4.metric("HTTP Calls / Errors", f"{summary['calls']} / {summary['errors']}")
+            l5.metric("In Flight", summary["in_flight"])
+
+        col_l1, col_l2 = st.columns([2, 1])
+        with col_l1:
+            df_latency = pd.DataFrame(call_metrics.samples(), columns=["Time", "Environment", "Seconds", "Outcome"])
+            df_latency["Time"] = df_latency["Time"].map(datetime.fromtimestamp)
+            df_latency["Latency (ms)"] = df_latency["Seconds"] * 1000
+            st.line_chart(df_latency, x="Time", y="Latency (ms)", color="Environment")
+        with col_l2:
+            outcomes = pd.Series({f"{env} · {outcome}": n for (env, outcome), n in call_metrics.outcome_counts().items()})
+            st.bar_chart(outcomes)
+        st.caption(f"Percentiles over the last {len(df_latency)} calls" + (f" · Prometheus metrics on port {metrics_server.server_address[1]} at /metrics" if metrics_server else ""))
+        st.markdown("<div style='height: 32px'></div>", unsafe_allow_html=True)
+
+    status_counts = pd.Series(history_status_counts(), dtype="int64")
+    if not status_counts.empty:
+        total_lookups = int(status_counts.sum())
+        live_calls = int(history_status_counts(group_by="source").get('Live', 0))
+        verified_count = int(status_counts.get('Verified', 0))
+        not_found_count = int(status_counts.get('Not Found', 0))
         
-        success_rate = round((verified_count / total_calls) * 100, 1) if total_calls > 0 else 0
+        success_rate = round((verified_count / total_lookups) * 100, 1) if total_lookups > 0 else 0
 
-        m1, m2, m3, m4 = st.columns(4)
-        m1.metric("Total API Calls", total_calls)
-        m2.metric("Verified Entities", verified_count)
-        m3.metric("Not Found", not_found_count)
-        m4.metric("Success Rate", f"{success_rate}%")
+        m1, m2, m3, m4, m5 = st.columns(5)
+        m1.metric("Total Lookups", total_lookups)
+        m2.metric("Live API Calls", live_calls, help="Lookups answered by the Cashfree API rather than the cache")
+        m3.metric("Verified Results", verified_count)
+        m4.metric("Not Found", not_found_count)
+        m5.metric("Success Rate", f"{success_rate}%")
 
         st.markdown("<div style='height: 32px'></div>", unsafe_allow_html=True)
         
@@ -446,13 +632,12 @@ elif selected_page == "Usage Analytics":
         
         with col_c1:
             st.subheader("Status Distribution")
-            status_counts = df['Status'].value_counts()
             st.bar_chart(status_counts)
         
         with col_c2:
             st.subheader("Live Feed")
             st.dataframe(
-                df.head(10), 
+                load_history_frame("", 10, 0, history_version()), 
                 use_container_width=True, 
                 hide_index=True,
                 column_config={
@@ -461,9 +646,40 @@ elif selected_page == "Usage Analytics":
                     "UDYAM NO.": st.column_config.TextColumn("UDYAM NO.", width="medium"),
                     "PAN": st.column_config.TextColumn("PAN", width="medium"),
                     "Entity Name": st.column_config.TextColumn("Entity Name", width="large"),
-                    "Time": st.column_config.TextColumn("Time", width="small"),
+                    "Time": st.column_config.TextColumn("Time", width="medium"),
+                    "Source": st.column_config.TextColumn("Source", width="small"),
                 }
             )
 
+        st.markdown("<div style='height: 32px'></div>", unsafe_allow_html=True)
+        st.subheader("Throughput")
+        t1, t2 = st.columns([1, 1])
+        with t1:
+            granularity = st.segmented_control("Granularity", list(STATS_WINDOWS), default="hour", format_func=str.title, label_visibility="collapsed") or "hour"
+        with t2:
+            environment_filter = st.selectbox("Environment", ["All", "Sandbox", "Production"], label_visibility="collapsed")
+        throughput = history_throughput(granularity, None if environment_filter == "All" else environment_filter.lower())
+        if throughput:
+            df_throughput = pd.DataFrame(throughput, columns=["Bucket", "Status", "Results"])
+            if granularity == "hour":
+                df_throughput["Bucket"] += ":00"
+            df_throughput = df_throughput.pivot(index="Bucket", columns="Status", values="Results").fillna(0)
+            st.bar_chart(df_throughput)
+            st.caption(f"Recorded results per {granularity} over the last {STATS_WINDOWS[granularity]} {granularity}s")
+        else:
+            st.caption(f"No results recorded in the last {STATS_WINDOWS[granularity]} {granularity}s.")
+
+        version = history_version()
+        enterprise_types = load_history_breakdown("enterprise_type", version)
+        if not enterprise_types.empty:
+            st.markdown("<div style='height: 32px'></div>", unsafe_allow_html=True)
+            col_e1, col_e2 = st.columns([1, 2])
+            with col_e1:
+                st.subheader("Entities by Enterprise Type")
+                st.bar_chart(enterprise_types)
+            with col_e2:
+                st.subheader("Verified Entities by State")
+                st.bar_chart(load_history_breakdown("state", version))
+
     else:
         st.info("Insufficient data to generate analytics. Please verify some entities first.")
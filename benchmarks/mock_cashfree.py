@@ -0,0 +1,129 @@
+"""Local stand-in for Cashfree's POST /verification/pan-udyam, for load tests without API credits.
+
+    python benchmarks/mock_cashfree.py --port 8787 --latency-ms 120 --error-rate 0.02 --rate-limit-rate 0.05
+
+Point the app or CLI at it with CORPVERIFY_SANDBOX_BASE_URL=http://127.0.0.1:8787/verification.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATES = ["MAHARASHTRA", "GUJARAT", "KARNATAKA", "TAMIL NADU", "DELHI", "UTTAR PRADESH"]
+ENTERPRISE_TYPES = ["Micro", "Small", "Medium"]
+
+class MockConfig:
+    def __init__(self, latency_ms=80.0, jitter_ms=20.0, error_rate=0.0, rate_limit_rate=0.0,
+                 not_found_rate=0.1, retry_after=1, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.not_found_rate = not_found_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def draw(self):
+        """Picks (delay_seconds, roll) for one request; Random isn't thread-safe, so lock it"""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            return delay, self.random.random()
+
+def fake_entity(pan):
+    # Derived from the PAN so repeat lookups return the same record
+    rng = random.Random(pan)
+    return {
+        "udyamNumber": f"UDYAM-{rng.choice(['MH', 'GJ', 'KA', 'TN', 'DL', 'UP'])}-{rng.randint(1, 40):02d}-{rng.randint(0, 9999999):07d}",
+        "name": f"{pan[:5]} ENTERPRISES PRIVATE LIMITED",
+        "enterprise_type": rng.choice(ENTERPRISE_TYPES),
+        "major_activity": rng.choice(["Manufacturing", "Services", "Trading"]),
+        "date_of_registration": f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "district": "DISTRICT " + str(rng.randint(1, 30)),
+        "state": rng.choice(STATES),
+    }
+
+def make_handler(config):
+
+    class MockCashfreeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; with Nagle on, keep-alive clients stall ~40 ms on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+            if not self.path.endswith("/pan-udyam"):
+                return self.reply(404, {"message": "Not Found"})
+            if not self.headers.get("x-client-id") or not self.headers.get("x-client-secret"):
+                return self.reply(401, {"message": "authentication Failed"})
+
+            delay, roll = config.draw()
+            time.sleep(delay)
+            if roll < config.rate_limit_rate:
+                return self.reply(429, {"message": "Too many requests"}, {"Retry-After": str(config.retry_after)})
+            roll -= config.rate_limit_rate
+            if roll < config.error_rate:
+                return self.reply(500, {"message": "Internal server error"})
+
+            request = json.loads(body or b"{}")
+            pan = request.get("pan", "")
+            if self.random_not_found(pan):
+                return self.reply(200, {"verification_id": request.get("verification_id"), "status": "UDYAM_NOT_FOUND", "pan": pan})
+            return self.reply(200, {"verification_id": request.get("verification_id"), "status": "SUCCESS", "pan": pan, "data": fake_entity(pan)})
+
+        def random_not_found(self, pan):
+            # Stable per PAN, so cache and re-verification behave like the real registry
+            return random.Random("nf" + pan).random() < config.not_found_rate
+
+        def reply(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockCashfreeHandler
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """Starts the stub on a daemon thread; returns (server, base_url) where base_url ends in /verification"""
+    config = config or MockConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, name="mock-cashfree", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/verification"
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Cashfree /verification/pan-udyam server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--not-found-rate", type=float, default=0.1, help="Fraction of PANs reported as UDYAM_NOT_FOUND")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate,
+                        args.not_found_rate, args.retry_after, args.seed)
+    server, base_url = start_mock_server(config, args.host, args.port)
+    print(f"Mock Cashfree listening on {base_url}/pan-udyam (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Offline performance benchmarks against the local mock Cashfree server.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --quick
+
+Measures single-lookup latency (live and cache hit), bulk throughput at several
+concurrency levels, History Log page build time and export time at 1k/10k/100k
+records. Writes a JSON report; nothing touches the real API or the app's database.
+"""
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_cashfree import MockConfig, start_mock_server
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+def percentiles_ms(samples):
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1000, 2)
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2)}
+
+def timed(fn, *args, repeat=1):
+    """Best-of-N wall time in milliseconds and the last result"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2), result
+
+def random_pans(n, seed=0):
+    rng = random.Random(seed)
+    letters = string.ascii_uppercase
+    return [
+        "".join(rng.choices(letters, k=3)) + rng.choice("PCFHT") + rng.choice(letters)
+        + f"{rng.randint(1, 9999):04d}" + rng.choice(letters)
+        for _ in range(n)
+    ]
+
+def bench_single(verifier, lookups):
+    pans = random_pans(lookups, seed=1)
+    credentials = verifier.single_credential("bench", "bench")
+    live, cached = [], []
+    for pan in pans:
+        started = time.perf_counter()
+        verifier.verify_pan(credentials, pan, True, force_refresh=True)
+        live.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        verifier.verify_pan(credentials, pan, True)
+        cached.append(time.perf_counter() - started)
+    return {"lookups": lookups, "live": percentiles_ms(live), "cache_hit": percentiles_ms(cached)}
+
+def bench_bulk(verifier, pans_per_run, concurrency_levels):
+    results = []
+    credentials = verifier.single_credential("bench", "bench")
+    for concurrency in concurrency_levels:
+        pans = random_pans(pans_per_run, seed=100 + concurrency)
+        statuses = {}
+        started = time.perf_counter()
+        for pan, response in verifier.verify_many(credentials, pans, True, concurrency, force_refresh=True):
+            row = verifier.summarize_response(pan, response)
+            statuses[row["Status"]] = statuses.get(row["Status"], 0) + 1
+        elapsed = time.perf_counter() - started
+        results.append({
+            "concurrency": concurrency,
+            "pans": len(pans),
+            "seconds": round(elapsed, 3),
+            "pans_per_second": round(len(pans) / elapsed, 1),
+            "statuses": statuses,
+        })
+    return results
+
+def populate_history(storage, size):
+    names = ["SHREE GANESH TRADERS", "BHARAT STEEL WORKS", "SUNRISE FOODS", "ACME INDUSTRIES", "NOVA TEXTILES"]
+    rng = random.Random(size)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [
+        (now, pan, f"UDYAM-MH-{rng.randint(1, 40):02d}-{i:07d}", f"{rng.choice(names)} {i}",
+         rng.choice(["Verified", "Verified", "Verified", "Not Found"]), "Live", "sandbox")
+        for i, pan in enumerate(random_pans(size, seed=size))
+    ]
+    with storage.closing(storage.get_db()) as conn, conn:
+        conn.executemany(
+            "INSERT INTO history (created_at, pan, udyam_number, entity_name, status, source, environment) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    return rows[len(rows) // 2][1]
+
+def build_page(storage, search_term):
+    """The data work behind one History Log rerun: counts, one page, DataFrame build"""
+    total = storage.count_history()
+    matched = storage.count_history(search_term) if search_term else total
+    df = storage.process_dataframe(storage.query_history(search_term, storage.HISTORY_PAGE_SIZE, 0))
+    return matched, len(df)
+
+def bench_history(storage, workdir, sizes, export_limit):
+    results = []
+    for size in sizes:
+        storage.DB_PATH = os.path.join(workdir, f"history_{size}.db")
+        sample_pan = populate_history(storage, size)
+        entry = {"records": size}
+        entry["page_ms"], _ = timed(build_page, storage, "", repeat=3)
+        entry["search_name_ms"], (matches, _) = timed(build_page, storage, "steel", repeat=3)
+        entry["search_name_matches"] = matches
+        entry["search_pan_ms"], _ = timed(build_page, storage, sample_pan, repeat=3)
+
+        if size <= export_limit:
+            entry["convert_df_to_excel_ms"], _ = timed(
+                lambda: storage.convert_df_to_excel(storage.process_dataframe(storage.query_history("", limit=None)))
+            )
+        for export_format in storage.EXPORT_FORMATS:
+            key = f"export_{export_format.lower()}_ms"
+            entry[key], output = timed(storage.export_history, "", export_format)
+            # Same conversion st.download_button applies to the callable's return value
+            with output:
+                data, _ = convert_data_to_bytes_and_infer_mime(output, TypeError(f"{export_format} export: unsupported download type"))
+            entry[f"export_{export_format.lower()}_bytes"] = len(data)
+        results.append(entry)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="CorpVerify offline benchmarks")
+    parser.add_argument("-o", "--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes for a fast smoke run")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock upstream mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    single_lookups, bulk_pans = (20, 100) if args.quick else (100, 500)
+    history_sizes = [1000, 10000] if args.quick else args.history_sizes
+    # The DataFrame + openpyxl path is the slow baseline; cap it so full runs stay reasonable
+    export_limit = 10000 if args.quick else 100000
+
+    config = MockConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, args.not_found_rate, retry_after=0, seed=42)
+    server, base_url = start_mock_server(config)
+    workdir = tempfile.mkdtemp(prefix="corpverify-bench-")
+
+    # Configure before the first import: settings are read from the environment at import time
+    os.environ.update({
+        "CORPVERIFY_SANDBOX_BASE_URL": base_url,
+        "CORPVERIFY_DB_PATH": os.path.join(workdir, "lookups.db"),
+        "CORPVERIFY_RATE_LIMIT_PER_SECOND": "1000000",
+        "CORPVERIFY_RATE_LIMIT_BURST": "1000000",
+        "CORPVERIFY_RETRY_BASE_DELAY": "0.05",
+        "CORPVERIFY_METRICS_PORT": "0",
+    })
+    import storage
+    import verifier
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": {key: getattr(config, key) for key in ("latency_ms", "jitter_ms", "error_rate", "rate_limit_rate", "not_found_rate")},
+    }
+    report["single_lookup"] = bench_single(verifier, single_lookups)
+    report["bulk_throughput"] = bench_bulk(verifier, bulk_pans, args.concurrency)
+    report["upstream_requests"] = config.requests
+    report["history"] = bench_history(storage, workdir, history_sizes, export_limit)
+    server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Headless batch runner for Udyam verification.
+
+    python cli.py verify vendors.csv --production --output results.jsonl
+    cat pans.txt | python cli.py verify - --format csv --concurrency 8 > results.csv
+    python cli.py reverify vendors.csv --max-age-days 30 --production --output changes.csv
+
+Credentials are read from CASHFREE_CREDENTIALS ('id:secret[:weight[:daily_quota]]' entries
+separated by commas, for a pool of keys) or CASHFREE_CLIENT_ID / CASHFREE_CLIENT_SECRET. Results
+are recorded in the same history store as the Streamlit app unless --no-history is given; daily
+quotas are counted there too, so the app and the CLI share them.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+from verifier import (
+    environment_name, read_pan_file, record_response, summarize_response, verify_many, prepare_pans, rejected_row,
+    serve_metrics, parse_credentials, single_credential, diff_response, CredentialConfigError,
+)
+from storage import latest_records, lookup_errors
+from metrics import get_call_metrics
+
+RESULT_FIELDS = ["PAN", "Status", "UDYAM NO.", "Entity Name", "Source", "Message", "Environment", "Verified At"]
+CHANGE_FIELDS = ["PAN", "Change", "Changes", "Status", "Previous Status", "UDYAM NO.", "Entity Name", "Last Verified",
+                 "Message", "Environment", "Verified At"]
+PROGRESS_EVERY = 100
+
+def read_pans(path):
+    if path == "-":
+        return read_pan_file(sys.stdin)
+    with open(path, "rb") as f:
+        return read_pan_file(f, path)
+
+def open_output(path):
+    if not path or path == "-":
+        return sys.stdout
+    return open(path, "w", newline="", encoding="utf-8")
+
+def output_format(args):
+    return args.format or ("csv" if (args.output or "").lower().endswith(".csv") else "jsonl")
+
+def result_writer(output, fmt, fields):
+    """Returns write(row) for CSV (header written now, unknown keys dropped) or JSONL output"""
+    if fmt == "csv":
+        writer = csv.DictWriter(output, fields, extrasaction="ignore")
+        writer.writeheader()
+        return writer.writerow
+    return lambda row: output.write(json.dumps(row) + "\n")
+
+def log(args, message):
+    if not args.quiet:
+        print(message, file=sys.stderr)
+
+def read_credentials():
+    if os.environ.get("CASHFREE_CREDENTIALS"):
+        return parse_credentials(os.environ["CASHFREE_CREDENTIALS"])
+    return single_credential(os.environ.get("CASHFREE_CLIENT_ID", ""), os.environ.get("CASHFREE_CLIENT_SECRET", ""))
+
+def run_verify(args):
+    credentials = read_credentials()
+    if not credentials:
+        print("error: set CASHFREE_CREDENTIALS, or CASHFREE_CLIENT_ID and CASHFREE_CLIENT_SECRET", file=sys.stderr)
+        return 2
+
+    raw_pans = read_pans(args.input)
+    if not raw_pans:
+        print("error: no PANs found in input", file=sys.stderr)
+        return 2
+    pans, rejected, duplicates = prepare_pans(raw_pans, args.strict)
+
+    use_sandbox = not args.production
+    environment = environment_name(use_sandbox)
+    log(args, f"Read {len(raw_pans)} rows: {len(pans)} unique valid PANs, {len(rejected)} rejected, {duplicates} duplicates skipped")
+    log(args, f"Verifying {len(pans)} PANs against {environment} with concurrency {args.concurrency} using {len(credentials)} API key(s)")
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+        log(args, f"Serving Prometheus metrics on :{args.metrics_port}/metrics")
+
+    counts = {}
+    started = time.monotonic()
+    output = open_output(args.output)
+    try:
+        write = result_writer(output, output_format(args), RESULT_FIELDS)
+
+        def emit(row, response=None):
+            row.update({"Environment": environment, "Verified At": datetime.now().isoformat(timespec="seconds")})
+            counts[row["Status"]] = counts.get(row["Status"], 0) + 1
+            if args.include_response and response is not None:
+                row["Response"] = response
+            write(row)
+
+        for pan, reason in rejected:
+            emit(rejected_row(pan, reason))
+
+        results = verify_many(credentials, pans, use_sandbox, args.concurrency, args.force_refresh)
+        for done, (pan, response) in enumerate(results, start=1):
+            emit(record_response(pan, response, environment) if args.history else summarize_response(pan, response), response)
+            if done % PROGRESS_EVERY == 0:
+                output.flush()
+                log(args, f"  {done} / {len(pans)}")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.monotonic() - started
+    summary = ", ".join(f"{status}: {n}" for status, n in sorted(counts.items()))
+    log(args, f"Done in {elapsed:.1f}s ({len(pans) / elapsed:.1f} PAN/s) - {summary}, Duplicates skipped: {duplicates}")
+    latency = get_call_metrics().summary().get(environment)
+    if latency and latency["calls"]:
+        log(args, "HTTP latency p50/p95/p99: " + " / ".join(f"{latency[q] * 1000:.0f} ms" for q in ("p50", "p95", "p99")))
+    return 1 if counts.get("Error") else 0
+
+def select_stale(pans, environment, max_age_days):
+    """Picks the PANs due for re-verification: never verified, last verified before the cutoff,
+    or errored since their last recorded result. `pans=None` means every PAN on record.
+
+    Only live lookups count: a cache hit replays an old response, so it doesn't make a PAN fresh.
+    Returns (checked, due, records): due is oldest-first, records the last live HistoryRecord per PAN.
+    """
+    records = latest_records(environment, pans, source="Live")
+    errors = lookup_errors(environment)
+    if pans is None:
+        # Includes PANs only ever served from cache; they have no live record and so come out due
+        pans = sorted(set(latest_records(environment)) | set(errors))
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+    due = [
+        pan for pan in pans
+        if pan not in records or records[pan].created_at < cutoff or errors.get(pan, "") > records[pan].created_at
+    ]
+    due.sort(key=lambda pan: records[pan].created_at if pan in records else "")
+    return len(pans), due, records
+
+def run_reverify(args):
+    credentials = read_credentials()
+    if not credentials and not args.dry_run:
+        print("error: set CASHFREE_CREDENTIALS, or CASHFREE_CLIENT_ID and CASHFREE_CLIENT_SECRET", file=sys.stderr)
+        return 2
+
+    rejected, duplicates = [], 0
+    pans = None
+    if args.input:
+        raw_pans = read_pans(args.input)
+        if not raw_pans:
+            print("error: no PANs found in input", file=sys.stderr)
+            return 2
+        pans, rejected, duplicates = prepare_pans(raw_pans, args.strict)
+
+    use_sandbox = not args.production
+    environment = environment_name(use_sandbox)
+    checked, due, records = select_stale(pans, environment, args.max_age_days)
+    if args.limit:
+        due = due[:args.limit]
+    log(args, f"Checked {checked} PANs against {environment} history: {len(due)} due (stale > {args.max_age_days:g} days, "
+              f"errored or never verified), {checked - len(due)} fresh skipped" + (f", {len(rejected)} rejected" if rejected else ""))
+
+    counts = {}
+    started = time.monotonic()
+    output = open_output(args.output)
+    try:
+        write = result_writer(output, output_format(args), CHANGE_FIELDS)
+        if args.dry_run:
+            for pan in due:
+                record = records.get(pan)
+                write({"PAN": pan, "Change": "Due", "Previous Status": record.status if record else "-",
+                       "Last Verified": record.created_at if record else "-", "Environment": environment})
+            return 0
+
+        for pan, reason in rejected:
+            write(dict(rejected_row(pan, reason), Change="Rejected", Environment=environment))
+
+        results = verify_many(credentials, due, use_sandbox, args.concurrency, force_refresh=True)
+        for done, (pan, response) in enumerate(results, start=1):
+            row = record_response(pan, response, environment) if args.history else summarize_response(pan, response)
+            record = records.get(pan)
+            change, details = diff_response(record, row, response)
+            counts[change] = counts.get(change, 0) + 1
+            row.update({
+                "Change": change,
+                "Changes": details,
+                "Previous Status": record.status if record else "-",
+                "Last Verified": record.created_at if record else "-",
+                "Environment": environment,
+                "Verified At": datetime.now().isoformat(timespec="seconds"),
+            })
+            if args.changes_only and change == "Unchanged":
+                continue
+            write(row)
+            if done % PROGRESS_EVERY == 0:
+                output.flush()
+                log(args, f"  {done} / {len(due)}")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.monotonic() - started
+    summary = ", ".join(f"{change}: {n}" for change, n in sorted(counts.items())) or "nothing to do"
+    log(args, f"Done in {elapsed:.1f}s - {summary}, Duplicates skipped: {duplicates}")
+    return 1 if counts.get("Error") else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="CorpVerify headless Udyam verification")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    verify = commands.add_parser("verify", help="Verify PANs from a file or stdin")
+    verify.add_argument("input", help="CSV/XLSX with a PAN column, a text file with one PAN per line, or - for stdin")
+    verify.add_argument("-o", "--output", help="Output file (default: stdout)")
+    verify.add_argument("-f", "--format", choices=["jsonl", "csv"], help="Output format (default: from --output extension, else jsonl)")
+    verify.add_argument("-c", "--concurrency", type=int, default=8, help="Parallel requests (default: 8)")
+    verify.add_argument("--production", action="store_true", help="Use the production API instead of the sandbox")
+    verify.add_argument("--strict", action="store_true", help="Also reject PANs that match the format but cannot have been issued")
+    verify.add_argument("--force-refresh", action="store_true", help="Bypass the lookup cache")
+    verify.add_argument("--no-history", dest="history", action="store_false", help="Don't record results in the history log")
+    verify.add_argument("--include-response", action="store_true", help="Include the raw API response in JSONL output")
+    verify.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port while running")
+    verify.add_argument("-q", "--quiet", action="store_true", help="Suppress progress output")
+    verify.set_defaults(handler=run_verify)
+
+    reverify = commands.add_parser("reverify", help="Re-verify only stale or errored PANs and report what changed")
+    reverify.add_argument("input", nargs="?", help="Vendor master (same formats as verify); default: every PAN in the history log")
+    reverify.add_argument("--max-age-days", type=float, default=30, help="Re-verify results older than this (default: 30)")
+    reverify.add_argument("--limit", type=int, default=0, help="Re-verify at most this many PANs, oldest first")
+    reverify.add_argument("--changes-only", action="store_true", help="Leave unchanged PANs out of the report")
+    reverify.add_argument("--dry-run", action="store_true", help="List the PANs that are due without calling the API")
+    reverify.add_argument("-o", "--output", help="Change report file (default: stdout)")
+    reverify.add_argument("-f", "--format", choices=["jsonl", "csv"], help="Output format (default: from --output extension, else jsonl)")
+    reverify.add_argument("-c", "--concurrency", type=int, default=8, help="Parallel requests (default: 8)")
+    reverify.add_argument("--production", action="store_true", help="Use the production API instead of the sandbox")
+    reverify.add_argument("--strict", action="store_true", help="Also reject PANs that match the format but cannot have been issued")
+    reverify.add_argument("--no-history", dest="history", action="store_false", help="Don't record results in the history log")
+    reverify.add_argument("-q", "--quiet", action="store_true", help="Suppress progress output")
+    reverify.set_defaults(handler=run_reverify)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "concurrency", 1) < 1:
+        print("error: --concurrency must be at least 1", file=sys.stderr)
+        return 2
+    try:
+        return args.handler(args)
+    except CredentialConfigError as e:
+        print(f"error: CASHFREE_CREDENTIALS: {e}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
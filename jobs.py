@@ -0,0 +1,205 @@
+"""Background verification jobs: a shared worker pool with job state persisted in SQLite.
+
+Submitting returns a job ID straight away; workers record every result as it finishes, so
+any session (or a later visit) can poll progress and read results incrementally. Each job
+keeps at most its own `concurrency` lookups in the pool, so one large batch can't starve
+other operators' jobs. Nothing in here depends on Streamlit.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+import functools
+from datetime import datetime
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from storage import get_db, pack_payload, unpack_payload
+from verifier import environment_name, verify_pan, record_response, rejected_row
+
+# --- Job Settings ---
+JOB_WORKERS = int(os.environ.get("CORPVERIFY_JOB_WORKERS", 32))
+ACTIVE_JOB_STATUSES = ("queued", "running")
+# Finished without completing every item; resuming re-runs only the pending ones
+RESUMABLE_JOB_STATUSES = ("interrupted", "failed")
+# Runners heartbeat while alive; active jobs whose runner has been silent this long are orphans
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("CORPVERIFY_JOB_HEARTBEAT_SECONDS", 10))
+JOB_OWNER_TIMEOUT_SECONDS = float(os.environ.get("CORPVERIFY_JOB_OWNER_TIMEOUT_SECONDS", 60))
+
+def timestamp():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+# --- Job State ---
+def create_job(kind, pans, environment, concurrency, force_refresh=False, rejected=(), duplicates=0, owner=None):
+    """Persists a job and its items; rejected (input, reason) pairs are stored as already finished"""
+    job_id = uuid.uuid4().hex[:12]
+    rejected_rows = [rejected_row(pan, reason) for pan, reason in rejected]
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, created_at, environment, status, concurrency, force_refresh, total, done, duplicates, owner) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, timestamp(), environment, concurrency, int(force_refresh),
+             len(rejected_rows) + len(pans), len(rejected_rows), duplicates, owner)
+        )
+        conn.executemany(
+            "INSERT INTO job_items (job_id, seq, pan, done_order, result) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, seq, row["PAN"], seq + 1, json.dumps(row)) for seq, row in enumerate(rejected_rows)]
+        )
+        conn.executemany(
+            "INSERT INTO job_items (job_id, seq, pan) VALUES (?, ?, ?)",
+            [(job_id, seq, pan) for seq, pan in enumerate(pans, start=len(rejected_rows))]
+        )
+    return job_id
+
+def get_job(job_id):
+    with closing(get_db()) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def list_jobs(limit=20):
+    """Most recent jobs first"""
+    with closing(get_db()) as conn:
+        return [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?", (limit,))]
+
+def job_results(job_id, after=0):
+    """Result rows in completion order, skipping the first `after` (so pollers only fetch what's new)"""
+    with closing(get_db()) as conn:
+        rows = conn.execute(
+            "SELECT result FROM job_items WHERE job_id = ? AND done_order > ? ORDER BY done_order",
+            (job_id, after)
+        ).fetchall()
+    return [json.loads(row["result"]) for row in rows]
+
+def job_response(job_id, seq=0):
+    """(pan, raw API response) for one finished item, or None while it is pending"""
+    with closing(get_db()) as conn:
+        row = conn.execute(
+            "SELECT pan, response FROM job_items WHERE job_id = ? AND seq = ? AND done_order IS NOT NULL",
+            (job_id, seq)
+        ).fetchone()
+    if row is None or row["response"] is None:
+        return None
+    return row["pan"], unpack_payload(row["response"])
+
+def pending_items(job_id):
+    with closing(get_db()) as conn:
+        return [tuple(row) for row in conn.execute(
+            "SELECT seq, pan FROM job_items WHERE job_id = ? AND done_order IS NULL ORDER BY seq", (job_id,)
+        )]
+
+def complete_item(job_id, seq, row, response):
+    with closing(get_db()) as conn, conn:
+        done = conn.execute("UPDATE jobs SET done = done + 1 WHERE id = ? RETURNING done", (job_id,)).fetchone()[0]
+        conn.execute(
+            "UPDATE job_items SET done_order = ?, result = ?, response = ? WHERE job_id = ? AND seq = ?",
+            (done, json.dumps(row), pack_payload(response), job_id, seq)
+        )
+
+def set_job_status(job_id, status):
+    finished_at = None if status in ACTIVE_JOB_STATUSES else timestamp()
+    with closing(get_db()) as conn, conn:
+        conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?", (status, finished_at, job_id))
+
+def status_placeholders(statuses):
+    return f"({', '.join('?' * len(statuses))})"
+
+def claim_job(job_id, owner):
+    """Atomically moves an interrupted or failed job back to queued under `owner`; False if it wasn't resumable"""
+    with closing(get_db()) as conn, conn:
+        return conn.execute(
+            "UPDATE jobs SET status = 'queued', finished_at = NULL, owner = ? "
+            f"WHERE id = ? AND status IN {status_placeholders(RESUMABLE_JOB_STATUSES)}",
+            (owner, job_id, *RESUMABLE_JOB_STATUSES)
+        ).rowcount == 1
+
+def heartbeat(owner):
+    with closing(get_db()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO job_runners (token, heartbeat_at) VALUES (?, ?)", (owner, time.time()))
+
+def mark_interrupted():
+    """Active jobs whose runner has stopped heartbeating (or that predate runner ownership) can't be running any more.
+
+    Other live servers sharing the database keep their jobs.
+    """
+    cutoff = time.time() - JOB_OWNER_TIMEOUT_SECONDS
+    with closing(get_db()) as conn, conn:
+        conn.execute("DELETE FROM job_runners WHERE heartbeat_at < ?", (cutoff,))
+        conn.execute(
+            f"UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE status IN {status_placeholders(ACTIVE_JOB_STATUSES)} "
+            "AND (owner IS NULL OR owner NOT IN (SELECT token FROM job_runners))",
+            (timestamp(), *ACTIVE_JOB_STATUSES)
+        )
+
+# --- Runner ---
+class JobRunner:
+    """Shared lookup pool; each job gets a dispatcher thread that keeps at most `concurrency` of its lookups in the pool"""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify-job")
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        heartbeat(self.token)
+        mark_interrupted()
+        threading.Thread(target=self.keep_alive, name="job-heartbeat", daemon=True).start()
+
+    def keep_alive(self):
+        """Refreshes this runner's heartbeat and reaps jobs of runners that have gone away"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                heartbeat(self.token)
+                mark_interrupted()
+            except Exception:
+                pass  # e.g. database busy; the next beat retries well within the owner timeout
+
+    def submit(self, credentials, pans, use_sandbox, concurrency, force_refresh=False,
+               rejected=(), duplicates=0, kind="bulk"):
+        """Queues a job and returns its ID immediately"""
+        job_id = create_job(kind, pans, environment_name(use_sandbox), concurrency, force_refresh, rejected, duplicates, self.token)
+        self.start(job_id, credentials)
+        return job_id
+
+    def resume(self, job_id, credentials):
+        """Restarts the unfinished items of an interrupted or failed job (credentials are never persisted).
+
+        Returns False when the job was no longer resumable, e.g. another session resumed it first.
+        """
+        if not claim_job(job_id, self.token):
+            return False
+        self.start(job_id, credentials)
+        return True
+
+    def start(self, job_id, credentials):
+        threading.Thread(target=self.run, args=(job_id, credentials), name=f"job-{job_id}", daemon=True).start()
+
+    def run(self, job_id, credentials):
+        job = get_job(job_id)
+        environment = job["environment"]
+        slots = threading.Semaphore(job["concurrency"])
+
+        def work(seq, pan):
+            try:
+                try:
+                    response = verify_pan(credentials, pan, environment == "sandbox", bool(job["force_refresh"]))
+                except Exception as e:
+                    response = {"status": "ERROR", "message": str(e)}
+                complete_item(job_id, seq, record_response(pan, response, environment), response)
+            finally:
+                slots.release()
+
+        set_job_status(job_id, "running")
+        futures = []
+        try:
+            for seq, pan in pending_items(job_id):
+                slots.acquire()
+                futures.append(self.pool.submit(work, seq, pan))
+            wait(futures)
+            status = "failed" if any(future.exception() for future in futures) else "completed"
+        except Exception:
+            status = "failed"
+        set_job_status(job_id, status)
+
+@functools.lru_cache(maxsize=None)
+def get_job_runner():
+    return JobRunner()
@@ -0,0 +1,144 @@
+"""In-process latency / throughput instrumentation for outbound verification calls.
+
+Keeps Prometheus-style histograms, outcome counters and in-flight gauges per
+environment, plus a bounded sample reservoir for percentile readouts and charts.
+Exposed in text format over a small HTTP endpoint (GET /metrics).
+"""
+import math
+import time
+import bisect
+import threading
+import functools
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+RECENT_SAMPLES = 2048
+
+def classify_status(status_code):
+    if status_code == 200:
+        return "ok"
+    if status_code == 429:
+        return "http_429"
+    return "http_5xx" if status_code >= 500 else "http_4xx"
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))]
+
+class CallMetrics:
+    """Thread-safe per-environment call timings, outcome counts and in-flight gauges"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.sums = {}
+        self.outcomes = {}
+        self.in_flight = {}
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def begin(self, environment):
+        with self.lock:
+            self.in_flight[environment] = self.in_flight.get(environment, 0) + 1
+        return time.perf_counter()
+
+    def end(self, environment, started, outcome):
+        seconds = time.perf_counter() - started
+        with self.lock:
+            self.in_flight[environment] -= 1
+            counts = self.buckets.setdefault(environment, [0] * len(LATENCY_BUCKETS))
+            counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.sums[environment] = self.sums.get(environment, 0.0) + seconds
+            self.outcomes[(environment, outcome)] = self.outcomes.get((environment, outcome), 0) + 1
+            self.recent.append((time.time(), environment, seconds, outcome))
+        return seconds
+
+    def samples(self):
+        """Recent (timestamp, environment, seconds, outcome) tuples, oldest first"""
+        with self.lock:
+            return list(self.recent)
+
+    def summary(self):
+        """Per-environment p50/p95/p99 (seconds, over recent samples), totals and in-flight counts"""
+        with self.lock:
+            recent = list(self.recent)
+            in_flight = dict(self.in_flight)
+            outcomes = dict(self.outcomes)
+        result = {}
+        for environment in sorted({env for _, env, _, _ in recent} | set(in_flight)):
+            latencies = sorted(s for _, env, s, _ in recent if env == environment)
+            result[environment] = {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "calls": sum(n for (env, _), n in outcomes.items() if env == environment),
+                "errors": sum(n for (env, outcome), n in outcomes.items() if env == environment and outcome != "ok"),
+                "in_flight": in_flight.get(environment, 0),
+            }
+        return result
+
+    def outcome_counts(self):
+        with self.lock:
+            return dict(self.outcomes)
+
+    def render_prometheus(self, counters=None):
+        """Prometheus text exposition; `counters` adds extra process-wide *_total series"""
+        with self.lock:
+            buckets = {env: list(counts) for env, counts in self.buckets.items()}
+            sums = dict(self.sums)
+            outcomes = dict(self.outcomes)
+            in_flight = dict(self.in_flight)
+
+        name = "corpverify_upstream_request_duration_seconds"
+        lines = [f"# HELP {name} Latency of Cashfree /pan-udyam HTTP calls.", f"# TYPE {name} histogram"]
+        for environment, counts in sorted(buckets.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, counts):
+                cumulative += n
+                le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+                lines.append(f'{name}_bucket{{environment="{environment}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{environment="{environment}"}} {sums[environment]:.6f}')
+            lines.append(f'{name}_count{{environment="{environment}"}} {cumulative}')
+
+        name = "corpverify_upstream_requests_total"
+        lines += [f"# HELP {name} Cashfree HTTP calls by outcome.", f"# TYPE {name} counter"]
+        for (environment, outcome), n in sorted(outcomes.items()):
+            lines.append(f'{name}{{environment="{environment}",outcome="{outcome}"}} {n}')
+
+        name = "corpverify_upstream_in_flight"
+        lines += [f"# HELP {name} Cashfree HTTP calls currently in flight.", f"# TYPE {name} gauge"]
+        for environment, n in sorted(in_flight.items()):
+            lines.append(f'{name}{{environment="{environment}"}} {n}')
+
+        for key, n in sorted((counters or {}).items()):
+            lines += [f"# TYPE corpverify_{key}_total counter", f"corpverify_{key}_total {n}"]
+        return "\n".join(lines) + "\n"
+
+@functools.lru_cache(maxsize=None)
+def get_call_metrics():
+    return CallMetrics()
+
+def start_metrics_server(port, render, host="127.0.0.1"):
+    """Serves render() at GET /metrics on a daemon thread; returns the server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,574 @@
+"""SQLite-backed lookup cache, verification history and history exports.
+
+Shared by the Streamlit app and the CLI; nothing in here depends on Streamlit.
+"""
+import os
+import re
+import io
+import csv
+import json
+import time
+import zlib
+import sqlite3
+import tempfile
+import threading
+import functools
+import pandas as pd
+from datetime import datetime, timedelta
+from contextlib import closing
+from openpyxl import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# --- Storage Settings ---
+DB_PATH = os.environ.get("CORPVERIFY_DB_PATH", "corpverify.db")
+
+HISTORY_PAGE_SIZE = int(os.environ.get("CORPVERIFY_HISTORY_PAGE_SIZE", 50))
+HISTORY_COLUMNS = ['S.No.', 'Status', 'UDYAM NO.', 'PAN', 'Entity Name', 'Time', 'Source']
+STATUS_CATEGORIES = ["Verified", "Not Found", "Error"]
+EXPORT_CHUNK_SIZE = int(os.environ.get("CORPVERIFY_EXPORT_CHUNK_SIZE", 5000))
+PAN_PATTERN = re.compile(r"^[A-Z]{5}[0-9]{4}[A-Z]$")
+UDYAM_PATTERN = re.compile(r"^UDYAM-[A-Z]{2}-\d{2}-\d{7}$")
+# Fields of the Cashfree `data` object copied into their own history columns (the full response is kept compressed)
+PAYLOAD_FIELDS = ("enterprise_type", "major_activity", "district", "state")
+
+# --- Usage Stats (bucket granularity -> bucket key length in created_at, and rows shown per chart) ---
+STATS_GRANULARITIES = {"minute": 16, "hour": 13, "day": 10}
+STATS_WINDOWS = {"minute": 60, "hour": 48, "day": 30}
+STATS_WINDOW_DELTAS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+STATS_MINUTE_RETENTION_DAYS = int(os.environ.get("CORPVERIFY_STATS_MINUTE_RETENTION_DAYS", 2))
+
+# --- Cache Settings (seconds / entries) ---
+CACHE_TTL_SUCCESS = int(os.environ.get("CORPVERIFY_CACHE_TTL_SUCCESS", 7 * 24 * 3600))
+CACHE_TTL_NOT_FOUND = int(os.environ.get("CORPVERIFY_CACHE_TTL_NOT_FOUND", 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("CORPVERIFY_CACHE_MAX_ENTRIES", 50000))
+
+# --- Database ---
+# One idle connection per database file, held for the life of the process. Without it every
+# short-lived connection is the last one to close, which checkpoints and fsyncs the WAL (~50 ms).
+anchor_connections = {}
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+def get_db():
+    init_db(DB_PATH)
+    return connect(DB_PATH)
+
+# Created with IF NOT EXISTS on every start; older databases are then migrated in init_db
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS udyam_cache (
+    pan TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    response TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (pan, environment)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_last_access ON udyam_cache (last_access);
+
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    pan TEXT NOT NULL,
+    udyam_number TEXT NOT NULL,
+    entity_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    enterprise_type TEXT,
+    major_activity TEXT,
+    district TEXT,
+    state TEXT,
+    payload BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_history_pan ON history (pan);
+CREATE INDEX IF NOT EXISTS idx_history_udyam ON history (udyam_number);
+CREATE INDEX IF NOT EXISTS idx_history_status ON history (status);
+CREATE INDEX IF NOT EXISTS idx_history_created_at ON history (created_at);
+
+CREATE TABLE IF NOT EXISTS stats_buckets (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    status TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    source TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, status, environment, source)
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    finished_at TEXT,
+    environment TEXT NOT NULL,
+    status TEXT NOT NULL,
+    concurrency INTEGER NOT NULL,
+    force_refresh INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    duplicates INTEGER NOT NULL DEFAULT 0,
+    owner TEXT
+);
+
+CREATE TABLE IF NOT EXISTS job_runners (
+    token TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);
+
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    pan TEXT NOT NULL,
+    done_order INTEGER,
+    result TEXT,
+    response BLOB,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_done ON job_items (job_id, done_order);
+
+-- Newest errored lookup per PAN: errors never reach history, and re-verification retries them
+CREATE TABLE IF NOT EXISTS lookup_errors (
+    environment TEXT NOT NULL,
+    pan TEXT NOT NULL,
+    at TEXT NOT NULL,
+    PRIMARY KEY (environment, pan)
+);
+
+CREATE TABLE IF NOT EXISTS key_usage (
+    client_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    PRIMARY KEY (client_id, day)
+);
+"""
+
+# Serializes first-time setup across threads; lru_cache alone lets concurrent first calls all run it
+init_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def init_db(path):
+    """Creates and migrates the on-disk schema once per process and database file.
+
+    Runs under init_lock and BEGIN IMMEDIATE, so concurrent threads and processes (app plus CLI)
+    migrate one at a time and each re-checks the schema it finds before changing it.
+    """
+    with init_lock, closing(connect(path)) as conn:
+        # WAL lets operators read history while verifications are being appended (can't change inside a transaction)
+        conn.execute("PRAGMA journal_mode = WAL")
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            stats_columns = {row["name"] for row in conn.execute("PRAGMA table_info(stats_buckets)")}
+            if stats_columns and "source" not in stats_columns:
+                # Counters from before they were split by source: rebuild them from the log below
+                conn.execute("DROP TABLE stats_buckets")
+            stats_exist = "source" in stats_columns
+            errors_exist = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'lookup_errors'").fetchone() is not None
+            # Statement by statement: executescript would commit the transaction first
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+
+            # History tables from before payload storage get the projected columns added in place
+            history_columns = {row["name"] for row in conn.execute("PRAGMA table_info(history)")}
+            for column in PAYLOAD_FIELDS + ("payload",):
+                if column not in history_columns:
+                    conn.execute(f"ALTER TABLE history ADD COLUMN {column} {'BLOB' if column == 'payload' else 'TEXT'}")
+            # (field, pan) indexes cover the distinct-entity breakdowns; they replace the single-column ones
+            conn.execute("DROP INDEX IF EXISTS idx_history_enterprise_type")
+            conn.execute("DROP INDEX IF EXISTS idx_history_state")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_enterprise_type_pan ON history (enterprise_type, pan)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_state_pan ON history (state, pan)")
+            # Job tables from before runner ownership; their unowned active jobs are reaped as orphans
+            if "owner" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+            if not stats_exist:
+                # Databases from before the rolling counters: aggregate the existing log once
+                for granularity, length in STATS_GRANULARITIES.items():
+                    conn.execute(
+                        "INSERT INTO stats_buckets (granularity, bucket, status, environment, source, count) "
+                        "SELECT ?, substr(created_at, 1, ?), status, environment, source, COUNT(*) FROM history GROUP BY 2, 3, 4, 5",
+                        (granularity, length)
+                    )
+                conn.execute(
+                    "INSERT INTO stats_buckets (granularity, bucket, status, environment, source, count) "
+                    "SELECT 'all', '', status, environment, source, COUNT(*) FROM history GROUP BY status, environment, source"
+                )
+
+            if not errors_exist:
+                # Databases from before the error log: seed it from errored background-job items
+                conn.execute(
+                    "INSERT INTO lookup_errors (environment, pan, at) SELECT jobs.environment, job_items.pan, MAX(jobs.created_at) "
+                    "FROM job_items JOIN jobs ON jobs.id = job_items.job_id "
+                    "WHERE json_extract(job_items.result, '$.Status') = 'Error' GROUP BY jobs.environment, job_items.pan"
+                )
+
+            # Full-text index over entity names, kept in sync by trigger (history is append-only)
+            fts_exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone() is not None
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5 (entity_name, content = 'history', content_rowid = 'id')"
+                )
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+                        INSERT INTO history_fts (rowid, entity_name) VALUES (new.id, new.entity_name);
+                    END
+                """)
+                if not fts_exists:
+                    conn.execute("INSERT INTO history_fts (history_fts) VALUES ('rebuild')")
+                fts_available = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: name search falls back to a LIKE scan
+                fts_available = False
+    anchor_connections.setdefault(path, connect(path))
+    return {"fts": fts_available}
+
+# --- Lookup Cache ---
+def cache_get(pan, environment):
+    """Returns a cached, unexpired response for the PAN or None"""
+    now = time.time()
+    with closing(get_db()) as conn, conn:
+        row = conn.execute(
+            "SELECT response, fetched_at FROM udyam_cache WHERE pan = ? AND environment = ? AND expires_at > ?",
+            (pan, environment, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE udyam_cache SET last_access = ? WHERE pan = ? AND environment = ?", (now, pan, environment))
+
+    response = json.loads(row["response"])
+    response["cached_at"] = datetime.fromtimestamp(row["fetched_at"]).strftime("%Y-%m-%d %H:%M:%S")
+    return response
+
+def cache_put(pan, environment, response):
+    """Stores definitive results (SUCCESS with data / UDYAM_NOT_FOUND) and evicts least-recently-used overflow"""
+    if response.get("status") == "SUCCESS" and response.get("data"):
+        ttl = CACHE_TTL_SUCCESS
+    elif response.get("status") == "UDYAM_NOT_FOUND":
+        ttl = CACHE_TTL_NOT_FOUND
+    else:
+        return
+    if ttl <= 0:
+        return
+
+    now = time.time()
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO udyam_cache (pan, environment, response, fetched_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (pan, environment, json.dumps(response), now, now + ttl, now)
+        )
+        conn.execute("DELETE FROM udyam_cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM udyam_cache WHERE rowid IN (SELECT rowid FROM udyam_cache ORDER BY last_access ASC "
+            "LIMIT max(0, (SELECT COUNT(*) FROM udyam_cache) - ?))",
+            (CACHE_MAX_ENTRIES,)
+        )
+
+# --- API Key Usage ---
+def claim_key_call(client_id, day, quota=None):
+    """Counts one call against a key for the day, shared by every process using the database.
+
+    Returns the key's calls that day including this one, or None if `quota` was already used up.
+    """
+    with closing(get_db()) as conn, conn:
+        row = conn.execute(
+            "INSERT INTO key_usage (client_id, day, calls) VALUES (?, ?, 1) "
+            "ON CONFLICT (client_id, day) DO UPDATE SET calls = calls + 1 WHERE ? IS NULL OR calls < ? RETURNING calls",
+            (client_id, day, quota, quota)
+        ).fetchone()
+        conn.execute("DELETE FROM key_usage WHERE day < ?", (day,))
+    return row["calls"] if row else None
+
+def key_calls(day):
+    """{client_id: calls} made on the given day"""
+    with closing(get_db()) as conn:
+        return {row["client_id"]: row["calls"] for row in conn.execute("SELECT client_id, calls FROM key_usage WHERE day = ?", (day,))}
+
+# --- Lookup Errors ---
+def record_lookup_error(pan, environment):
+    """Notes that a lookup of the PAN just ended in an error"""
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO lookup_errors (environment, pan, at) VALUES (?, ?, ?) ON CONFLICT (environment, pan) DO UPDATE SET at = excluded.at",
+            (environment, pan, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+
+def lookup_errors(environment):
+    """{pan: time of its newest errored lookup} for the environment"""
+    with closing(get_db()) as conn:
+        return {row["pan"]: row["at"] for row in conn.execute("SELECT pan, at FROM lookup_errors WHERE environment = ?", (environment,))}
+
+# --- Payloads ---
+def pack_payload(response):
+    """Compact storage form of an API response: zlib-compressed minified JSON"""
+    return zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf-8"))
+
+def unpack_payload(blob):
+    if blob is None:
+        return None
+    # job_items written before payloads were compressed hold plain JSON text
+    return json.loads(blob if isinstance(blob, str) else zlib.decompress(blob))
+
+class HistoryRecord:
+    """One history row; the raw response is only decompressed when asked for"""
+    __slots__ = ("id", "created_at", "pan", "udyam_number", "entity_name", "status", "source", "environment",
+                 "enterprise_type", "major_activity", "district", "state", "payload")
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, row[field])
+
+    def response(self):
+        """The stored API response, or None for rows recorded before payloads were kept"""
+        return unpack_payload(self.payload)
+
+# --- History ---
+def add_to_history(pan, name, udyam, status, source="Live", environment="sandbox", response=None):
+    """Appends a verification to the shared history log and bumps its usage counters in the same transaction"""
+    data = (response or {}).get("data") or {}
+    projected = tuple(data.get(field) for field in PAYLOAD_FIELDS)
+    payload = pack_payload(response) if response is not None else None
+    now = datetime.now()
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    buckets = [(granularity, created_at[:length]) for granularity, length in STATS_GRANULARITIES.items()] + [("all", "")]
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO history (created_at, pan, udyam_number, entity_name, status, source, environment, "
+            "enterprise_type, major_activity, district, state, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (created_at, pan, udyam, name, status, source, environment) + projected + (payload,)
+        )
+        conn.executemany(
+            "INSERT INTO stats_buckets (granularity, bucket, status, environment, source, count) VALUES (?, ?, ?, ?, ?, 1) "
+            "ON CONFLICT (granularity, bucket, status, environment, source) DO UPDATE SET count = count + 1",
+            [(granularity, bucket, status, environment, source) for granularity, bucket in buckets]
+        )
+        # Minute buckets are only charted for the last hour; don't let them grow without bound
+        cutoff = (now - timedelta(days=STATS_MINUTE_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M")
+        conn.execute("DELETE FROM stats_buckets WHERE granularity = 'minute' AND bucket < ?", (cutoff,))
+
+def history_filter(search_term):
+    """Builds an index-backed WHERE clause: exact PAN / Udyam lookups, code prefixes and entity-name tokens"""
+    term = search_term.strip().upper()
+    if not term:
+        return "", ()
+    if PAN_PATTERN.match(term):
+        return " WHERE pan = ?", (term,)
+    if UDYAM_PATTERN.match(term):
+        return " WHERE udyam_number = ?", (term,)
+    if term.startswith("UDYAM-"):
+        return " WHERE udyam_number >= ? AND udyam_number < ?", (term, term + "\uffff")
+
+    # Anything else may be a PAN prefix or part of a name; both sides of the OR use an index
+    tokens = re.findall(r"\w+", search_term)
+    if not tokens:
+        return " WHERE pan >= ? AND pan < ?", (term, term + "\uffff")
+    if init_db(DB_PATH)["fts"]:
+        name_clause = "id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)"
+        name_param = " ".join(f'"{token}"*' for token in tokens)
+    else:
+        name_clause = "entity_name LIKE ?"
+        name_param = f"%{search_term.strip()}%"
+    return f" WHERE (pan >= ? AND pan < ?) OR {name_clause}", (term, term + "\uffff", name_param)
+
+def count_history(search_term=""):
+    where, params = history_filter(search_term)
+    with closing(get_db()) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
+
+def query_history(search_term="", limit=HISTORY_PAGE_SIZE, offset=0):
+    """Returns one page of history rows, newest first (limit=None returns every match)"""
+    where, params = history_filter(search_term)
+    sql = (
+        'SELECT created_at AS "Time", udyam_number AS "UDYAM NO.", pan AS "PAN", entity_name AS "Entity Name", '
+        f'status AS "Status", source AS "Source" FROM history{where} ORDER BY id DESC'
+    )
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += (limit, offset)
+    with closing(get_db()) as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+def history_record(search_term="", offset=0):
+    """The HistoryRecord at `offset` in query_history's order (newest first), or None"""
+    where, params = history_filter(search_term)
+    with closing(get_db()) as conn:
+        row = conn.execute(f"SELECT * FROM history{where} ORDER BY id DESC LIMIT 1 OFFSET ?", params + (offset,)).fetchone()
+    return HistoryRecord(row) if row else None
+
+def latest_records(environment, pans=None, source=None, chunk_size=500):
+    """{pan: newest HistoryRecord} for the given PANs (every recorded PAN when None); payloads aren't loaded.
+
+    `source` restricts it to rows of that source, e.g. 'Live' for when a PAN was last actually fetched.
+    """
+    columns = ", ".join("NULL AS payload" if field == "payload" else field for field in HistoryRecord.__slots__)
+    where, params = "environment = ?", (environment,)
+    if source is not None:
+        where, params = where + " AND source = ?", params + (source,)
+    sql = f"SELECT {columns} FROM history WHERE id IN (SELECT MAX(id) FROM history WHERE {where}{{}} GROUP BY pan)"
+    records = {}
+    with closing(get_db()) as conn:
+        if pans is None:
+            rows = conn.execute(sql.format(""), params).fetchall()
+        else:
+            pans = list(pans)
+            rows = []
+            for i in range(0, len(pans), chunk_size):
+                chunk = pans[i:i + chunk_size]
+                rows += conn.execute(sql.format(f" AND pan IN ({', '.join('?' * len(chunk))})"), params + tuple(chunk)).fetchall()
+    for row in rows:
+        records[row["pan"]] = HistoryRecord(row)
+    return records
+
+def history_breakdown(field):
+    """Distinct verified PANs per value of a projected payload field, largest first.
+
+    Repeat lookups of a PAN count once (a PAN seen with two values counts under both). Reads
+    only the (field, pan) index rather than the rows and their payloads.
+    """
+    if field not in PAYLOAD_FIELDS:
+        raise ValueError(f"Unknown payload field: {field}")
+    with closing(get_db()) as conn:
+        return {row["value"]: row["n"] for row in conn.execute(
+            f"SELECT {field} AS value, COUNT(DISTINCT pan) AS n FROM history WHERE {field} IS NOT NULL GROUP BY value ORDER BY n DESC"
+        )}
+
+def history_version():
+    """Monotonic version of the (append-only) history log: the newest row id"""
+    with closing(get_db()) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+
+def history_status_counts(environment=None, group_by="status"):
+    """Totals per status (or per `source`: Live API call vs Cache) from the running counters.
+
+    Constant time, however long the log is.
+    """
+    if group_by not in ("status", "source"):
+        raise ValueError(f"Unknown grouping: {group_by}")
+    sql = f"SELECT {group_by} AS value, SUM(count) AS n FROM stats_buckets WHERE granularity = 'all'"
+    params = ()
+    if environment:
+        sql += " AND environment = ?"
+        params = (environment,)
+    with closing(get_db()) as conn:
+        return {row["value"]: row["n"] for row in conn.execute(sql + f" GROUP BY {group_by}", params)}
+
+def history_throughput(granularity, environment=None):
+    """Recorded results per status over the most recent STATS_WINDOWS[granularity] buckets, oldest first.
+
+    Returns (bucket, status, count) rows; buckets are created_at prefixes, e.g. '2024-05-01 14' for an hour.
+    """
+    length = STATS_GRANULARITIES[granularity]
+    since = (datetime.now() - STATS_WINDOW_DELTAS[granularity] * STATS_WINDOWS[granularity]).strftime("%Y-%m-%d %H:%M:%S")[:length]
+    sql = "SELECT bucket, status, SUM(count) AS n FROM stats_buckets WHERE granularity = ? AND bucket > ?"
+    params = (granularity, since)
+    if environment:
+        sql += " AND environment = ?"
+        params += (environment,)
+    with closing(get_db()) as conn:
+        return [tuple(row) for row in conn.execute(sql + " GROUP BY bucket, status ORDER BY bucket", params)]
+
+def process_dataframe(data_list, start=1):
+    """Standardizes the dataframe structure"""
+    if not data_list:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(data_list)
+    # Create S.No. (start to start + N - 1; pages continue the numbering)
+    df.insert(0, 'S.No.', range(start, start + len(df)))
+
+    # STRICT COLUMN ORDER
+    for col in HISTORY_COLUMNS:
+        if col not in df.columns:
+            df[col] = "-"
+
+    # Fixed dtypes: a categorical Status and plain strings keep frames compact and cheap to cache
+    dtypes = {col: "string" for col in HISTORY_COLUMNS}
+    dtypes.update({'S.No.': "int64", 'Status': pd.CategoricalDtype(STATUS_CATEGORIES)})
+    return df[HISTORY_COLUMNS].astype(dtypes)
+
+# --- Export ---
+def iter_history_rows(search_term="", chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields matching history rows (newest first, in HISTORY_COLUMNS order) in chunks via keyset pagination"""
+    where, params = history_filter(search_term)
+    condition = f"({where[len(' WHERE '):]}) AND " if where else ""
+    sql = (
+        "SELECT id, status, udyam_number, pan, entity_name, created_at, source FROM history "
+        f"WHERE {condition}id < ? ORDER BY id DESC LIMIT ?"
+    )
+    last_id = history_version() + 1
+    sno = 1
+    with closing(get_db()) as conn:
+        while True:
+            rows = conn.execute(sql, params + (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [(sno + i, *tuple(row)[1:]) for i, row in enumerate(rows)]
+            sno += len(rows)
+            last_id = rows[-1]["id"]
+
+def write_xlsx(chunks, output, columns=HISTORY_COLUMNS):
+    # Write-only workbooks stream rows to disk instead of building the whole sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Verification History')
+    sheet.append(list(columns))
+    for chunk in chunks:
+        for row in chunk:
+            sheet.append(row)
+    workbook.save(output)
+
+def write_csv(chunks, output, columns=HISTORY_COLUMNS):
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+    text.flush()
+    text.detach()
+
+def write_parquet(chunks, output, columns=HISTORY_COLUMNS):
+    schema = pa.schema([(col, pa.int64() if col == 'S.No.' else pa.string()) for col in columns])
+    with pq.ParquetWriter(output, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in chunk], schema=schema))
+
+EXPORT_FORMATS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+    "CSV": ("csv", "text/csv", write_csv),
+}
+if pq is not None:
+    EXPORT_FORMATS["Parquet"] = ("parquet", "application/vnd.apache.parquet", write_parquet)
+
+def export_history(search_term, export_format):
+    """Streams matching history into a temporary file; called lazily when the download is clicked.
+
+    Returns the file reopened read-only: st.download_button takes a BufferedReader but rejects the
+    BufferedRandom of a TemporaryFile. The path is unlinked straight away, so the file is gone
+    once the reader is closed.
+    """
+    extension, _, writer = EXPORT_FORMATS[export_format]
+    fd, path = tempfile.mkstemp(prefix="corpverify-export-", suffix=f".{extension}")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            writer(iter_history_rows(search_term), output)
+        return open(path, "rb")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Windows can't unlink a file that is still open
+
+def convert_df_to_excel(df):
+    output = io.BytesIO()
+    write_xlsx([df.itertuples(index=False, name=None)], output, df.columns)
+    return output.getvalue()
@@ -0,0 +1,637 @@
+"""Verification core: the Cashfree /pan-udyam client and result normalization.
+
+Wraps the raw API call with a keep-alive session, a pool of API keys with per-key rate
+limiters, retry with backoff and a circuit breaker, and puts the SQLite lookup cache in
+front of it. Used by both the Streamlit app and the CLI; nothing in here depends on
+Streamlit.
+"""
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import threading
+import functools
+import requests
+from collections import namedtuple
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from storage import cache_get, cache_put, add_to_history, claim_key_call, key_calls, record_lookup_error
+from metrics import classify_status, get_call_metrics, start_metrics_server
+
+# --- API Settings ---
+CASHFREE_BASE_URLS = {
+    "sandbox": os.environ.get("CORPVERIFY_SANDBOX_BASE_URL", "https://sandbox.cashfree.com/verification"),
+    "production": os.environ.get("CORPVERIFY_PRODUCTION_BASE_URL", "https://api.cashfree.com/verification"),
+}
+HTTP_POOL_MAXSIZE = int(os.environ.get("CORPVERIFY_HTTP_POOL_MAXSIZE", 32))
+
+# --- Credential Pool Settings (seconds a key is benched after a 429 without Retry-After / an auth error) ---
+CREDENTIAL_COOLDOWN_SECONDS = float(os.environ.get("CORPVERIFY_CREDENTIAL_COOLDOWN_SECONDS", 10))
+CREDENTIAL_AUTH_COOLDOWN_SECONDS = float(os.environ.get("CORPVERIFY_CREDENTIAL_AUTH_COOLDOWN_SECONDS", 300))
+
+# --- Rate Limit / Retry Settings (per API key and environment, shared by all sessions) ---
+RATE_LIMIT_PER_SECOND = float(os.environ.get("CORPVERIFY_RATE_LIMIT_PER_SECOND", 10))
+RATE_LIMIT_BURST = int(os.environ.get("CORPVERIFY_RATE_LIMIT_BURST", 10))
+RETRY_MAX_ATTEMPTS = int(os.environ.get("CORPVERIFY_RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.environ.get("CORPVERIFY_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.environ.get("CORPVERIFY_RETRY_MAX_DELAY", 8))
+RETRY_AFTER_MAX = float(os.environ.get("CORPVERIFY_RETRY_AFTER_MAX", 30))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CORPVERIFY_CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CORPVERIFY_CIRCUIT_RESET_SECONDS", 30))
+
+# --- Metrics Endpoint (0 disables it; unauthenticated, so loopback-only unless overridden) ---
+METRICS_PORT = int(os.environ.get("CORPVERIFY_METRICS_PORT", 9108))
+METRICS_HOST = os.environ.get("CORPVERIFY_METRICS_HOST", "127.0.0.1")
+
+# --- PAN Format (AAAAA9999A; the 4th character encodes the holder type) ---
+PAN_FORMAT = re.compile(r"^[A-Z]{3}([A-Z])[A-Z][0-9]{4}[A-Z]$")
+PAN_ENTITY_TYPES = {
+    "P": "Individual",
+    "C": "Company",
+    "H": "Hindu Undivided Family",
+    "F": "Firm / LLP",
+    "A": "Association of Persons",
+    "T": "Trust",
+    "B": "Body of Individuals",
+    "L": "Local Authority",
+    "J": "Artificial Juridical Person",
+    "G": "Government",
+}
+
+def normalize_pan(raw):
+    """Uppercases and strips whitespace, dots and hyphens (e.g. 'abcde 1234-f' -> 'ABCDE1234F')"""
+    return re.sub(r"[\s.\-]", "", str(raw)).upper()
+
+def validate_pan(pan, strict=False):
+    """Returns None for a well-formed PAN, else a short reason it was rejected.
+
+    Strict mode adds heuristics beyond the published format: PAN serials run from
+    0001, so an all-zero serial cannot have been issued.
+    """
+    if len(pan) != 10:
+        return f"Must be 10 characters (got {len(pan)})"
+    match = PAN_FORMAT.match(pan)
+    if not match:
+        return "Must match the format AAAAA9999A"
+    if match.group(1) not in PAN_ENTITY_TYPES:
+        return f"Unknown entity type '{match.group(1)}' at position 4"
+    if strict and pan[5:9] == "0000":
+        return "Serial number 0000 is never issued"
+    return None
+
+def prepare_pans(raw_pans, strict=False):
+    """Normalizes, validates and de-duplicates a batch, so each valid PAN costs at most one call.
+
+    Returns (pans, rejected, duplicates): unique valid PANs in input order, (input, reason)
+    pairs for invalid rows, and the number of repeated rows dropped.
+    """
+    pans, rejected, seen = [], [], set()
+    duplicates = 0
+    for raw in raw_pans:
+        pan = normalize_pan(raw)
+        reason = validate_pan(pan, strict)
+        if reason:
+            rejected.append((raw, reason))
+        elif pan in seen:
+            duplicates += 1
+        else:
+            seen.add(pan)
+            pans.append(pan)
+    return pans, rejected, duplicates
+
+# --- Credentials ---
+# weight scales a key's share of the traffic; daily_quota (optional) caps its calls per calendar day,
+# counted in the database so the app and the CLI share it and restarts don't reset it
+ApiCredential = namedtuple("ApiCredential", ["client_id", "client_secret", "weight", "daily_quota"], defaults=(1.0, None))
+
+class CredentialConfigError(ValueError):
+    """A configured API key has an unusable weight or daily quota"""
+
+def parse_weight(client_id, weight):
+    try:
+        weight = float(1 if weight in (None, "") else weight)
+    except (TypeError, ValueError):
+        weight = None
+    if weight is None or not math.isfinite(weight) or weight <= 0:
+        raise CredentialConfigError(f"API key {mask_client_id(client_id)}: weight must be a positive number")
+    return weight
+
+def parse_quota(client_id, quota):
+    if quota in (None, ""):
+        return None
+    try:
+        quota = int(str(quota).strip())
+    except ValueError:
+        quota = 0
+    if quota < 1:
+        raise CredentialConfigError(f"API key {mask_client_id(client_id)}: daily_quota must be a whole number of at least 1 (omit it for no limit)")
+    return quota
+
+def parse_credentials(value):
+    """Normalizes credentials into a hashable tuple of ApiCredential.
+
+    Accepts a list of mappings (client_id, client_secret, optional weight / daily_quota, as in
+    st.secrets) or a string of 'id:secret[:weight[:daily_quota]]' entries separated by commas or
+    whitespace (as in the CASHFREE_CREDENTIALS environment variable). Raises CredentialConfigError
+    for a weight that isn't positive or a daily_quota below 1.
+    """
+    if isinstance(value, str):
+        value = [dict(zip(ApiCredential._fields, entry.split(":"))) for entry in re.split(r"[\s,]+", value.strip()) if entry]
+    credentials = []
+    for entry in value or ():
+        client_id, client_secret = str(entry.get("client_id", "")).strip(), str(entry.get("client_secret", "")).strip()
+        if client_id and client_secret:
+            credentials.append(ApiCredential(client_id, client_secret, parse_weight(client_id, entry.get("weight")),
+                                             parse_quota(client_id, entry.get("daily_quota"))))
+    return tuple(credentials)
+
+def single_credential(client_id, client_secret):
+    """The one-key pool behind a plain CASHFREE_CLIENT_ID / CASHFREE_CLIENT_SECRET pair (empty if either is missing)"""
+    return parse_credentials([{"client_id": client_id, "client_secret": client_secret}])
+
+def mask_client_id(client_id):
+    return client_id if len(client_id) <= 8 else f"{client_id[:4]}…{client_id[-4:]}"
+
+def environment_name(use_sandbox):
+    return "sandbox" if use_sandbox else "production"
+
+@functools.lru_cache(maxsize=None)
+def get_http_session():
+    """Keep-alive session shared by every caller in the process, with one pool per base URL"""
+    session = requests.Session()
+    for base_url in CASHFREE_BASE_URLS.values():
+        # pool_block makes surplus workers wait for a free connection instead of opening throwaway ones
+        session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True))
+    return session
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is free and returns the seconds waited"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures, then lets a single trial call through once the cool-down ends"""
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+class ApiStats:
+    """Process-wide counters for retries, throttling, circuit rejections and coalesced lookups"""
+
+    def __init__(self):
+        self.counts = {"retries": 0, "throttled": 0, "rate_limited": 0, "circuit_rejections": 0, "coalesced": 0}
+        self.lock = threading.Lock()
+
+    def incr(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key: the first caller runs it, the rest wait for its result"""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """Returns (result, shared); shared is True when this caller piggybacked on another's call"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+        if not leader:
+            return call.result(), True
+
+        try:
+            call.set_result(fn(*args))
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return call.result(), False
+
+class CredentialPool:
+    """Least-loaded weighted selection over API keys, with per-key usage counts, daily quotas and cool-downs"""
+
+    def __init__(self, credentials):
+        self.keys = [
+            {"credential": credential, "in_flight": 0, "calls": 0, "rate_limited": 0, "auth_errors": 0,
+             "cooldown_until": 0.0, "day": None, "day_calls": 0}
+            for credential in credentials
+        ]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def within_quota(self, key, today):
+        quota = key["credential"].daily_quota
+        return quota is None or key["day"] != today or key["day_calls"] < quota
+
+    def acquire(self, max_wait=RETRY_AFTER_MAX):
+        """Picks the ready key with the lowest load per unit of weight, waiting up to max_wait for
+        a cool-down to end; returns None when no key can be used (all over quota or benched)"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.lock:
+                now, today = time.monotonic(), date.today()
+                usable = [key for key in self.keys if self.within_quota(key, today)]
+                ready = [key for key in usable if key["cooldown_until"] <= now]
+                while ready:
+                    # Ties on load (e.g. sequential calls, all idle) go to the key furthest behind its share
+                    key = min(ready, key=lambda k: (k["in_flight"] / k["credential"].weight, k["calls"] / k["credential"].weight))
+                    credential = key["credential"]
+                    day_calls = claim_key_call(credential.client_id, today.isoformat(), credential.daily_quota)
+                    key["day"] = today
+                    if day_calls is None:
+                        # Another process used up the rest of this key's quota
+                        key["day_calls"] = credential.daily_quota
+                        ready.remove(key)
+                        continue
+                    key["day_calls"] = day_calls
+                    key["in_flight"] += 1
+                    key["calls"] += 1
+                    return key
+                usable = [key for key in self.keys if self.within_quota(key, today)]
+                wait_for = min((key["cooldown_until"] - now for key in usable), default=None)
+            if wait_for is None or now + wait_for > deadline:
+                return None
+            time.sleep(wait_for)
+
+    def release(self, key, status_code=None, retry_after=None):
+        """Returns a key after a call, benching it on a 429 or an auth failure"""
+        with self.lock:
+            key["in_flight"] -= 1
+            if status_code == 429:
+                key["rate_limited"] += 1
+                cooldown = min(CREDENTIAL_COOLDOWN_SECONDS if retry_after is None else retry_after, RETRY_AFTER_MAX)
+            elif status_code in (401, 403):
+                key["auth_errors"] += 1
+                cooldown = CREDENTIAL_AUTH_COOLDOWN_SECONDS
+            else:
+                return
+            # A lone key has nothing to fail over to; the caller's backoff already honours Retry-After
+            if len(self.keys) > 1:
+                key["cooldown_until"] = time.monotonic() + cooldown
+
+    def snapshot(self):
+        """Per-key status rows for display (client IDs masked); today's calls include other processes'"""
+        today = date.today()
+        calls_today = key_calls(today.isoformat())
+        with self.lock:
+            now = time.monotonic()
+            rows = []
+            for key in self.keys:
+                credential = key["credential"]
+                key["day"], key["day_calls"] = today, calls_today.get(credential.client_id, 0)
+                if not self.within_quota(key, today):
+                    state = "over quota"
+                elif key["cooldown_until"] > now:
+                    state = f"cooling {key['cooldown_until'] - now:.0f}s"
+                else:
+                    state = "ready"
+                rows.append({
+                    "Key": mask_client_id(credential.client_id),
+                    "Weight": credential.weight,
+                    "State": state,
+                    "In Flight": key["in_flight"],
+                    "Calls": key["calls"],
+                    "Today": f"{key['day_calls']} / {credential.daily_quota or '∞'}",
+                    "429s": key["rate_limited"],
+                    "Auth Errors": key["auth_errors"],
+                })
+            return rows
+
+@functools.lru_cache(maxsize=None)
+def get_credential_pool(credentials):
+    """One pool per distinct credential set, so every session and job using the same keys shares their state"""
+    return CredentialPool(credentials)
+
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter(environment, client_id):
+    return TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+
+@functools.lru_cache(maxsize=None)
+def get_circuit_breaker(environment):
+    return CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+
+@functools.lru_cache(maxsize=None)
+def get_api_stats():
+    return ApiStats()
+
+@functools.lru_cache(maxsize=None)
+def get_single_flight():
+    return SingleFlight()
+
+def render_metrics():
+    return get_call_metrics().render_prometheus(get_api_stats().snapshot())
+
+def serve_metrics(port, host=METRICS_HOST):
+    """Starts the Prometheus /metrics endpoint for this process"""
+    return start_metrics_server(port, render_metrics, host)
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RETRY_AFTER_MAX))
+    return delay
+
+def fetch_udyam_details(credentials, pan_number, use_sandbox):
+    """Calls /pan-udyam with a key drawn from the credentials' pool (see parse_credentials / single_credential)"""
+    if not credentials:
+        return {
+            "status": "ERROR", 
+            "message": "API Keys Missing. Please provide Client ID and Secret in sidebar (or CASHFREE_CLIENT_ID / CASHFREE_CLIENT_SECRET)."
+        }
+
+    environment = environment_name(use_sandbox)
+    endpoint = f"{CASHFREE_BASE_URLS[environment]}/pan-udyam"
+
+    stats = get_api_stats()
+    call_metrics = get_call_metrics()
+    breaker = get_circuit_breaker(environment)
+    pool = get_credential_pool(credentials)
+    if not breaker.allow():
+        stats.incr("circuit_rejections")
+        return {"status": "ERROR", "message": "Verification API is unavailable (circuit open). Please retry shortly."}
+
+    # Everything past allow() may hold the half-open trial slot, so any unexpected error must release it
+    try:
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            key = pool.acquire()
+            if key is None:
+                # Not an upstream failure: every key is over its daily quota or benched for auth errors
+                breaker.record_success()
+                return {"status": "ERROR", "message": "No API key available (daily quotas used up or keys rejected). Please retry later."}
+            credential = key["credential"]
+            retry_after = None
+            status_code = None
+            try:
+                if get_rate_limiter(environment, credential.client_id).acquire() > 0:
+                    stats.incr("throttled")
+                outcome = "exception"
+                started = call_metrics.begin(environment)
+                try:
+                    response = get_http_session().post(endpoint, headers={
+                        "x-client-id": credential.client_id,
+                        "x-client-secret": credential.client_secret,
+                        "Content-Type": "application/json",
+                    }, data=json.dumps({
+                        "verification_id": str(uuid.uuid4()),
+                        "pan": pan_number
+                    }), timeout=10)
+                    outcome = classify_status(response.status_code)
+                    status_code = response.status_code
+                except requests.exceptions.Timeout:
+                    outcome = "timeout"
+                    raise
+                except requests.exceptions.ConnectionError:
+                    outcome = "connection_error"
+                    raise
+                finally:
+                    call_metrics.end(environment, started, outcome)
+                    if status_code == 429:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+                if response.status_code == 200:
+                    breaker.record_success()
+                    return response.json()
+
+                try:
+                    err_data = response.json()
+                    result = {"status": "ERROR", "message": err_data.get("message", response.reason)}
+                except:
+                    result = {"status": "ERROR", "message": f"HTTP {response.status_code}: {response.reason}"}
+
+                if response.status_code == 429:
+                    stats.incr("rate_limited")
+                elif response.status_code in (401, 403) and len(pool) > 1:
+                    # That key is benched; another one in the pool may still be valid
+                    pass
+                elif response.status_code < 500:
+                    # Client errors are definitive: the upstream is healthy, retrying won't help
+                    breaker.record_success()
+                    return result
+            except requests.exceptions.Timeout:
+                result = {"status": "ERROR", "message": "Request timed out."}
+            except requests.exceptions.ConnectionError as e:
+                result = {"status": "ERROR", "message": str(e)}
+            except Exception as e:
+                breaker.record_failure()
+                return {"status": "ERROR", "message": str(e)}
+            finally:
+                pool.release(key, status_code, retry_after)
+
+            if attempt == RETRY_MAX_ATTEMPTS:
+                break
+            stats.incr("retries")
+            # With several keys the next attempt goes to another one, so only a lone key has to sit out Retry-After
+            time.sleep(backoff_delay(attempt, retry_after if len(pool) == 1 else None))
+
+        # A 429 (or rejected key) means the upstream is up, so only 5xx/timeouts trip the breaker
+        if status_code is None or status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return result
+    except Exception as e:
+        breaker.record_failure()
+        return {"status": "ERROR", "message": str(e)}
+    except BaseException:
+        breaker.record_failure()
+        raise
+
+def fetch_and_cache(credentials, pan_number, use_sandbox):
+    response = fetch_udyam_details(credentials, pan_number, use_sandbox)
+    cache_put(pan_number, environment_name(use_sandbox), response)
+    return response
+
+def verify_pan(credentials, pan_number, use_sandbox, force_refresh=False):
+    """Cache-aware front for fetch_udyam_details; hits carry a 'cached_at' timestamp.
+
+    Concurrent misses for the same PAN and environment share one upstream call.
+    """
+    environment = environment_name(use_sandbox)
+    if not force_refresh:
+        cached = cache_get(pan_number, environment)
+        if cached is not None:
+            return cached
+
+    response, shared = get_single_flight().do(
+        (pan_number, environment), fetch_and_cache, credentials, pan_number, use_sandbox
+    )
+    if shared:
+        get_api_stats().incr("coalesced")
+        # Callers annotate their copy (e.g. the CLI's --include-response), so don't hand out the leader's dict
+        response = dict(response)
+    return response
+
+def verify_many(credentials, pans, use_sandbox, concurrency, force_refresh=False):
+    """Verifies PANs on a bounded worker pool, yielding (pan, response) as each one finishes"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(verify_pan, credentials, pan, use_sandbox, force_refresh): pan for pan in pans}
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {"status": "ERROR", "message": str(e)}
+            yield futures[future], response
+
+def summarize_response(pan, response):
+    """Maps an API response onto a result row (Verified / Not Found / Error)"""
+    row = {"Status": "Error", "UDYAM NO.": "-", "PAN": pan, "Entity Name": "-", "Source": "Cache" if response.get("cached_at") else "Live", "Message": ""}
+    status = response.get("status")
+    data = response.get("data") or {}
+
+    if status == "SUCCESS" and data:
+        row.update({"Status": "Verified", "UDYAM NO.": data.get("udyamNumber", "N/A"), "Entity Name": data.get("name", "N/A")})
+    elif status == "SUCCESS":
+        row["Message"] = "API returned Success but no data."
+    elif status == "UDYAM_NOT_FOUND":
+        row.update({"Status": "Not Found", "Entity Name": "Unknown"})
+    else:
+        row["Message"] = response.get("message", "Unknown Error")
+    return row
+
+# Fields compared on re-verification: report label -> (history column, key in the API's `data`)
+DIFF_FIELDS = {
+    "Entity Name": ("entity_name", "name"),
+    "Enterprise Type": ("enterprise_type", "enterprise_type"),
+    "State": ("state", "state"),
+}
+
+def diff_response(record, row, response):
+    """Compares a fresh result with the last recorded one (a HistoryRecord, or None if never recorded).
+
+    Returns (change, details): change is one of New / Error / Status Changed / Changed / Unchanged,
+    details a '; '-joined list of 'Field: old -> new'. Fields the old record never stored are skipped.
+    """
+    if row["Status"] == "Error":
+        return "Error", row["Message"]
+    if record is None:
+        return "New", ""
+    if record.status != row["Status"]:
+        return "Status Changed", f"Status: {record.status} -> {row['Status']}"
+    if row["Status"] != "Verified":
+        return "Unchanged", ""
+
+    data = response.get("data") or {}
+    details = [
+        f"{label}: {getattr(record, column)} -> {data.get(key)}"
+        for label, (column, key) in DIFF_FIELDS.items()
+        if getattr(record, column) is not None and getattr(record, column) != data.get(key)
+    ]
+    return ("Changed", "; ".join(details)) if details else ("Unchanged", "")
+
+def rejected_row(pan, reason):
+    return {"Status": "Rejected", "UDYAM NO.": "-", "PAN": pan, "Entity Name": "-", "Source": "-", "Message": reason}
+
+def record_response(pan, response, environment):
+    """Summarizes a response and logs it to history when it is a definitive result (errors go to the error log)"""
+    row = summarize_response(pan, response)
+    if row["Status"] != "Error":
+        add_to_history(pan, row["Entity Name"], row["UDYAM NO."], row["Status"], row["Source"], environment, response)
+    else:
+        record_lookup_error(pan, environment)
+    return row
+
+def read_pan_file(file, name=None):
+    """Reads PANs from a CSV/XLSX ('PAN' column, else the first column) or a plain one-PAN-per-line file"""
+    name = (name or getattr(file, "name", "")).lower()
+    if name.endswith(".csv"):
+        df = pd.read_csv(file, dtype=str)
+    elif name.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(file, dtype=str)
+    else:
+        lines = (line.decode("utf-8") if isinstance(line, bytes) else line for line in file)
+        # One PAN per line; tolerate a 'PAN' header and CSV rows with the PAN first
+        pans = (line.split(",")[0].strip().strip('"').upper() for line in lines)
+        return [p for p in pans if p and p != "PAN"]
+    if df.empty:
+        return []
+
+    pan_col = next((c for c in df.columns if str(c).strip().upper() == "PAN"), df.columns[0])
+    pans = df[pan_col].dropna().astype(str).str.strip().str.upper()
+    return [p for p in pans if p]